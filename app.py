@@ -1,12 +1,46 @@
-import tkinter as tk
-from tkinter import ttk, messagebox, font, simpledialog
+import argparse
+import getpass
 import json
-from datetime import datetime, date
-import os
+import threading
+import time
+import tkinter as tk
+from datetime import date, datetime, timedelta
+from tkinter import ttk
+from history import CallRecorder, HistoryStore
+from model import CHECKLIST_CHANGES, PERSISTED_CHANGES, ChecklistModel, Definitions, parse_data, read_files
+from storage import FileLock, Journal, WriteBehindSaver, write_snapshot
+# Dialogs, search, library import/export, metrics and server sync are imported where
+# they are first used, so a cold start only pays for what the home page needs.
+
+# Call type buttons on the home page; only this many exist however long the catalogue is.
+HOME_ROWS = 9
+# Matches listed by the task search page.
+SEARCH_RESULTS = 50
+# Startup finishes this long after launch even if the window is never exposed (e.g. minimised).
+STARTUP_DEADLINE_MS = 1000
+# Changes are journaled as they happen; checklists.json itself is rewritten once no change
+# has come for CHECKPOINT_DELAY seconds, at most CHECKPOINT_MAX_DELAY seconds after the first
+# unwritten change (so other instances and tools see it), or once the journal has grown past
+# JOURNAL_LIMIT bytes.
+CHECKPOINT_DELAY = 2.0
+CHECKPOINT_MAX_DELAY = 10.0
+JOURNAL_LIMIT = 64 * 1024
+# Longest wait between day checks, so a day change is noticed soon after waking from sleep.
+DAY_CHECK_MS = 60 * 1000
+# Methods timed when metrics are enabled; any of them can start a user action.
+INSTRUMENTED = ('toggle_task', 'display_tasks', 'save_data', 'render_row', 'edit_task', 'delete_task',
+                'click_sub_item', 'toggle_expanded', 'new_call', 'show_home_page', 'show_call_sub_menu',
+                'show_checklist_page', 'show_search_page', 'run_search', 'open_home_slot', 'filter_home',
+                'import_library', 'export_library')
 
 class ChecklistApp:
-    def __init__(self, root):
+    def __init__(self, root, metrics=None, server_url=None, agent=None):
         self.root = root
+        # Optional Metrics instance; None (the default) leaves the app uninstrumented.
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.instrument(self, INSTRUMENTED)
+            self.root.bind("<Control-D>", lambda event: metrics.toggle_panel())
         self.root.title("Call Centre Checklist")
         self.root.geometry("400x800")
         self.root.configure(bg="#ffffff")
@@ -42,25 +76,33 @@ class ChecklistApp:
                              borderwidth=2,
                              relief='raised',
                              font=('Segoe UI', 10))
-        self.style.configure('Completed.TButton',
-                             background='green',
-                             foreground='white',
-                             padding=(10, 5),
-                             borderwidth=2,
-                             relief='raised',
-                             font=('Segoe UI', 10))
         self.style.configure('Custom.TEntry',
                              fieldbackground=self.colors['secondary_bg'],
                              borderwidth=0,
                              padding=10)
         
-        # Define our call types and checklist modes
-        self.call_types = ["sales", "reengagement", "followup", "at-risk", "support", "introduction"]
-        self.checklist_options = ["voicemail", "start call"]
-        
+        # The data and rules live in a GUI-free model; this class only drives it.
         # Data file and checklists structure: data is organized by call type then checklist option
         self.data_file = "checklists.json"
-        self.checklists = self.load_data()
+        # Precompiled copy of the definitions and data files, rewritten after every save.
+        self.snapshot_file = self.data_file + ".snapshot"
+        self.sources, parsed, self.from_snapshot = read_files(self.data_file, self.snapshot_file)
+        self.definitions_data, self.startup_data = parsed
+        self.model = ChecklistModel(Definitions(self.definitions_data))
+        self.definitions = self.model.definitions
+        self.call_types = self.model.call_types
+        self.definitions_source = self.sources[0]
+        # Call types merged from other instances by the writer thread (or received from the
+        # checklist server by the sync thread), applied on the Tk thread.
+        self.merged_call_types = set()
+        self.saver = None
+        self.sync = None
+        self.server_url = server_url
+        self.agent = agent
+        # Loading the data and starting the writer, history and sync threads wait until
+        # the home page has been drawn; see finish_startup().
+        self.started = False
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # The container which we will use to switch between views
         self.container = ttk.Frame(self.root, style='Custom.TFrame', padding="10")
@@ -70,365 +112,689 @@ class ChecklistApp:
         self.current_call_type = None
         self.current_checklist_type = None
         
-        # To reference the task entry and tasks frame in the checklist view
+        # To reference the task entry in the checklist view
         self.task_entry = None
-        self.tasks_frame = None
         
-        # Instance variables for Objection mini sub-checklist (Sales, Start Call only)
-        self.objection_subchecklist_data = None
-        # (We recreate the mini checklist UI each time in display_tasks)
+        # Home page list state: lowercased labels to search, the call types matching the
+        # search, the first one shown, and the slot buttons showing them.
+        self.home_index = [(self.definitions.label(ct).lower(), ct) for ct in self.call_types]
+        self.home_matches = list(self.call_types)
+        self.home_offset = 0
+        self.home_search = tk.StringVar()
+        self.home_slots = []
+        self.home_scrollbar = None
+        
+        # Task search: the index is built the first time the search page opens, then kept
+        # up to date from model changes.
+        self.task_index = None
+        self.search_query = tk.StringVar()
+        self.search_results = []
+        self.search_entry = None
+        self.search_list = None
+        
+        # Pages are built once and cached by (call_type, checklist_type); the home page is
+        # (None, None) and a call type's sub menu is (call_type, None).
+        self.pages = {}
+        self.current_page = None
+        # Shortcuts are looked up on the current page instead of being re-bound per page.
+        self.root.bind("<Key>", self.on_key)
+        self.root.bind("<Control-f>", lambda event: self.show_search_page())
         
         self.show_home_page()
+        # The first Expose means the window is on screen; its redraw runs at the next idle
+        # point, and the rest of startup right after it. The timer covers a window that
+        # starts minimised and is never exposed.
+        self.root.bind("<Expose>", self.on_first_expose)
+        self.root.after(STARTUP_DEADLINE_MS, self.finish_startup)
+
+    def on_first_expose(self, event):
+        self.root.unbind("<Expose>")
+        self.root.after_idle(self.finish_startup)
+
+    def finish_startup(self):
+        # Everything the home page does not show. Also called by the actions that need the
+        # data, in case one runs before the idle callback; only the first call does anything.
+        if self.started:
+            return
+        self.started = True
+        self.style.configure('Completed.TButton',
+                             background='green',
+                             foreground='white',
+                             padding=(10, 5),
+                             borderwidth=2,
+                             relief='raised',
+                             font=('Segoe UI', 10))
+        # Each change is journaled as it happens (by the journal's own thread) and replayed
+        # onto the data file at the next start if the app dies before the file is rewritten.
+        # A long journal has the file rewritten right away.
+        self.journal = Journal(self.data_file + ".journal", limit=JOURNAL_LIMIT,
+                               checkpoint=lambda: self.saver.mark_dirty(urgent=True))
+        # Journal records of the model operation in progress; see on_model_change().
+        self.journal_batch = []
+        events = self.journal.read()
+        self.load_data(events)
+        # Writes happen on a background thread, so clicks never wait on disk I/O. Other
+        # instances may share the file: reads and writes hold a lock file, and their
+        # edits are merged in rather than overwritten.
+        self.saver = WriteBehindSaver(self.data_file, self.serialize_data, delay=CHECKPOINT_DELAY,
+                                      max_delay=CHECKPOINT_MAX_DELAY,
+                                      file_lock=FileLock(self.data_file + ".lock"),
+                                      poll=lambda: self.model.reload_changed(self.data_file),
+                                      written=self.checkpointed)
+        if events:
+            # Fold the recovered changes into the data file now.
+            self.saver.mark_dirty(urgent=True)
+        self.model.listeners.append(self.on_model_change)
+        # With a checklist server the local file is an offline cache, synced in the background.
+        if self.server_url:
+            from sync import ServerSync
+            # Changes recovered from the journal may not have reached the server before a crash.
+            self.sync = ServerSync(self.model, self.server_url, self.agent, pending_path=self.data_file + ".pending",
+                                   unsent=events)
+        self.root.after(500, self.apply_merges)
+        # Daily checklists are reset at midnight while the app stays open.
+        self.today = date.today()
+        self.schedule_day_check()
+        # Each call session is recorded to SQLite in batches off the UI thread.
+        self.history = HistoryStore("history.sqlite3")
+        self.recorder = CallRecorder(self.history, self.model)
+        if not self.from_snapshot:
+            # Let the next start skip the JSON parse. The files are parsed again on another
+            # thread, since the model now shares the dicts parsed here.
+            sources = self.sources
+            threading.Thread(target=lambda: self.write_snapshot_file(
+                sources, (json.loads(sources[0]), parse_data(sources[1]))), name="snapshot-writer", daemon=True).start()
+        self.sources = self.startup_data = None
     
-    def clear_container(self):
-        # Remove all widgets from the container
-        for widget in self.container.winfo_children():
-            widget.destroy()
+    def load_data(self, events=()):
+        return self.model.load(self.data_file, self.startup_data, events)
+
+    def checkpointed(self, data):
+        # Called by the writer thread with the bytes it has just written.
+        self.journal.commit()
+        self.write_snapshot_file([self.definitions_source, data], (self.definitions_data, json.loads(data)))
+
+    def write_snapshot_file(self, sources, parsed):
+        try:
+            write_snapshot(self.snapshot_file, sources, parsed)
+        except OSError:
+            pass  # Only a cache: the next start parses the JSON instead.
     
-    def load_data(self):
-        data = {}
-        today = date.today().isoformat()
-        if os.path.exists(self.data_file):
-            with open(self.data_file, 'r') as f:
-                try:
-                    data = json.load(f)
-                except Exception:
-                    data = {}
-        
-        # Define preset tasks for each call type / checklist option.
-        default_voicemail_tasks = [
-            {'text': 'Purpose', 'done': False},
-            {'text': 'Call to Action', 'done': False},
-            {'text': 'Timeframe', 'done': False}
-        ]
-        sales_start_call_tasks = [
-            {'text': 'Rapport Question', 'done': False},
-            {'text': '2nd Open Question', 'done': False},
-            {'text': 'Value Add Item', 'done': False},
-            {'text': 'Great Ask for Sale', 'done': False},
-            {'text': 'Objection', 'done': False},
-            {'text': 'Implement Sale Now or "How & When"', 'done': False},
-            {'text': 'Anything Else they want to Ask?', 'done': False},
-            {'text': 'Summarise Call', 'done': False},
-            {'text': 'Book Followup or Next Steps', 'done': False}
-        ]
-        # Reengagement uses the same tasks as Sales.
-        reengagement_start_call_tasks = sales_start_call_tasks
-        introduction_start_call_tasks = [
-            {'text': 'Repport Question', 'done': False},
-            {'text': '2nd Open Question', 'done': False},
-            {'text': 'Value Add Item', 'done': False},
-            {'text': 'Learn their Current Situation', 'done': False},
-            {'text': 'Learn their Desired Situation', 'done': False},
-            {'text': 'Identify their Gap (& Problem Solve or Connect to Us)', 'done': False},
-            {'text': 'Additional Support Required?', 'done': False},
-            {'text': 'Anything Else they want to Ask?', 'done': False},
-            {'text': 'Summarise Call', 'done': False},
-            {'text': 'Book Next Call or Followup Steps', 'done': False}
-        ]
-        followup_start_call_tasks = [
-            {'text': 'Rapport Question', 'done': False},
-            {'text': '2nd Open Question', 'done': False},
-            {'text': 'Value Add Item', 'done': False},
-            {'text': 'Extra Support Required?', 'done': False},
-            {'text': 'Anything they want to Ask?', 'done': False},
-            {'text': 'Summarise Call', 'done': False},
-            {'text': 'Book Followup or Next Steps', 'done': False}
-        ]
-        support_start_call_tasks = self.get_support_start_call_tasks()
-        at_risk_start_call_tasks = [
-            {'text': 'Rapport Question', 'done': False},
-            {'text': '2nd Open Question', 'done': False},
-            {'text': 'Uncover the Problem', 'done': False},
-            {'text': 'Problem Solve', 'done': False},
-            {'text': 'Objection', 'done': False},
-            {'text': 'Connect course to Motivation/Their Gap', 'done': False},
-            {'text': 'Great Ask for Sale', 'done': False},
-            {'text': 'Additional Support Required', 'done': False},
-            {'text': 'Summarise Call', 'done': False},
-            {'text': 'Book Followup or Next Steps', 'done': False}
-        ]
-        
-        preset_tasks = {
-            ("sales", "voicemail"): default_voicemail_tasks,
-            ("sales", "start call"): sales_start_call_tasks,
-            ("reengagement", "voicemail"): default_voicemail_tasks,
-            ("reengagement", "start call"): reengagement_start_call_tasks,
-            ("followup", "voicemail"): default_voicemail_tasks,
-            ("followup", "start call"): followup_start_call_tasks,
-            ("at-risk", "voicemail"): default_voicemail_tasks,
-            ("at-risk", "start call"): at_risk_start_call_tasks,
-            ("support", "voicemail"): default_voicemail_tasks,
-            ("support", "start call"): support_start_call_tasks,
-            ("introduction", "voicemail"): default_voicemail_tasks,
-            ("introduction", "start call"): introduction_start_call_tasks
-        }
-        
-        # Ensure every call type has both checklist options.
-        for ct in self.call_types:
-            if ct not in data:
-                data[ct] = {}
-            for option in self.checklist_options:
-                if option not in data[ct]:
-                    data[ct][option] = {
-                        'daily_refresh': False,
-                        'tasks': preset_tasks.get((ct, option), []),
-                        'last_refresh': today
-                    }
-                else:
-                    checklist = data[ct][option]
-                    # If the tasks list is empty and we have a preset, then fill it.
-                    if not checklist.get("tasks"):
-                        preset = preset_tasks.get((ct, option), [])
-                        if preset:
-                            checklist["tasks"] = preset
-                    # If daily refresh is enabled and the last refresh date isn't today, reset tasks' done status.
-                    if checklist.get('daily_refresh', False) and checklist.get('last_refresh', '') != today:
-                        for task in checklist.get('tasks', []):
-                            task['done'] = False
-                        checklist['last_refresh'] = today
+    def serialize_data(self):
+        # Called on the writer thread while holding the shared file lock. The journal is
+        # rotated with the model locked, so it then holds only changes the write will miss.
+        with self.model.lock:
+            data = self.model.sync(self.data_file)
+            self.journal.rotate()
         return data
-    
+
     def save_data(self):
-        with open(self.data_file, 'w') as f:
-            json.dump(self.checklists, f, indent=4)
+        # Only flags the data as dirty; the saver coalesces and writes it later.
+        self.saver.mark_dirty()
+
+    def flush_journal(self):
+        # Hand the records of one model operation to the journal thread as one append.
+        batch, self.journal_batch = self.journal_batch, []
+        if batch:
+            self.journal.append(batch)
+
+    def on_model_change(self, kind, call_type, checklist_type, index):
+        # Changes made elsewhere are re-rendered from the Tk thread; anything persisted is saved.
+        if kind in ('merge', 'server', 'template'):
+            self.merged_call_types.add(call_type)
+        if kind in PERSISTED_CHANGES:
+            if kind == 'toggle' or kind in CHECKLIST_CHANGES:
+                events = self.model.change_events(kind, call_type, checklist_type, index, with_base=True)
+                if threading.current_thread() is not threading.main_thread():
+                    self.journal.append(events)
+                else:
+                    # An operation such as the daily reset or an import reports one change
+                    # per checklist; they are all journaled together once it returns.
+                    if not self.journal_batch:
+                        self.root.after_idle(self.flush_journal)
+                    self.journal_batch.extend(events)
+            self.save_data()
+
+    def apply_merges(self):
+        # Re-render pages whose call type another instance changed; polled since Tk is not thread-safe.
+        while self.merged_call_types:
+            call_type = self.merged_call_types.pop()
+            for option in self.model.checklist_options:
+                self.invalidate_page(call_type, option)
+                self.prune_expanded(call_type, option)
+            page = self.pages.get((call_type, self.current_checklist_type))
+            if call_type == self.current_call_type and page is not None and page is self.current_page:
+                self.display_tasks()
+        self.root.after(500, self.apply_merges)
+
+    def schedule_day_check(self):
+        # Wake up just after midnight, or sooner: timers may not count time spent asleep.
+        midnight = datetime.combine(self.today + timedelta(days=1), datetime.min.time())
+        wait_ms = int((midnight.timestamp() - time.time()) * 1000) + 1000
+        self.root.after(max(1000, min(wait_ms, DAY_CHECK_MS)), self.check_day)
+
+    def check_day(self):
+        # Reset the stale daily checklists once the date has changed; the model change
+        # notifications mark the data dirty and the write-behind saver writes them once.
+        if date.today() != self.today:
+            self.today = date.today()
+            for call_type, checklist_type in self.model.refresh_daily(self.today.isoformat()):
+                self.invalidate_page(call_type, checklist_type)
+                self.prune_expanded(call_type, checklist_type)
+                page = self.pages.get((call_type, checklist_type))
+                if page is not None and page is self.current_page:
+                    self.display_tasks()
+        self.schedule_day_check()
+
+    def shutdown(self):
+        # Close the open call and flush any pending writes; safe to call more than once.
+        if self.started:
+            self.recorder.end()
+            self.history.close()
+            # Journal everything first, so the final write of the data file covers it all.
+            self.flush_journal()
+            self.journal.flush()
+            self.saver.close()
+            self.journal.close()
+            if self.sync is not None:
+                self.sync.close()
+        if self.metrics is not None:
+            self.metrics.close()
+
+    def on_close(self):
+        self.shutdown()
+        self.root.destroy()
     
+    def show_page(self, key, build):
+        # Raise the cached page for `key`, building it with `build(page)` the first time.
+        page = self.pages.get(key)
+        if page is None:
+            page = Page(self.container)
+            build(page)
+            self.pages[key] = page
+        if self.current_page is not page:
+            if self.current_page is not None:
+                self.current_page.frame.pack_forget()
+            page.frame.pack(fill=tk.BOTH, expand=True)
+            self.current_page = page
+        return page
+
+    def invalidate_page(self, call_type, checklist_type):
+        # Mark a cached checklist page as out of date; it is re-rendered the next time it is shown.
+        page = self.pages.get((call_type, checklist_type))
+        if page is not None:
+            page.stale = True
+
+    def prune_expanded(self, call_type, checklist_type):
+        # Forget shown sub-checklists whose task was moved, renamed or removed by a change made elsewhere.
+        page = self.pages.get((call_type, checklist_type))
+        if page is None or not page.expanded:
+            return
+        page.expanded = {path for path in page.expanded
+                         if self.model.sub_checklist(call_type, checklist_type, path) is not None}
+
+    def on_key(self, event):
+        # Single root key handler: dispatch to the shortcuts of the page currently shown.
+        if isinstance(event.widget, (tk.Entry, ttk.Entry)) or self.current_page is None:
+            return
+        action = self.current_page.keys.get(event.keysym.lower())
+        if action is not None:
+            if self.metrics is not None:
+                self.metrics.begin(f"key {event.keysym.lower()}")
+            action()
+
     def show_home_page(self):
-        # Unbind keys used for previous shortcuts.
-        self.root.unbind("<Key-v>")
-        self.root.unbind("<Key-V>")
-        self.root.unbind("<Key-s>")
-        self.root.unbind("<Key-S>")
-        # Unbind numeric keys so we have a clean slate.
-        for i in range(1, 10):
-            self.root.unbind(f"<Key-{i}>")
-        
-        self.clear_container()
-        title = ttk.Label(self.container, text="Finish Your Checklist", style='Title.TLabel')
+        self.show_page((None, None), self.build_home_page)
+
+    def build_home_page(self, page):
+        title = ttk.Label(page.frame, text="Finish Your Checklist", style='Title.TLabel')
         title.pack(pady=(0, 20))
-        instruction = ttk.Label(self.container, text="Select Call Type:", style='Header.TLabel')
+        instruction = ttk.Label(page.frame, text="Select Call Type:", style='Header.TLabel')
         instruction.pack(pady=(0, 10))
-        
-        for i, ct in enumerate(self.call_types, start=1):
-            # For 'at-risk', adjust the display text to "At-Risk".
-            display_name = ct.capitalize() if ct != "at-risk" else "At-Risk"
-            button_text = f"{i}. {display_name} Call"
-            btn = ttk.Button(self.container, text=button_text,
-                             command=lambda ct=ct: self.show_call_sub_menu(ct),
-                             style='Accent.TButton')
+
+        # Search box: filters the call types as you type; Enter opens the first match.
+        search = ttk.Entry(page.frame, textvariable=self.home_search, style='Custom.TEntry')
+        search.pack(fill=tk.X, padx=10, pady=(0, 10))
+        search.bind("<Return>", lambda event: self.open_home_slot(0))
+        search.bind("<Escape>", lambda event: (self.home_search.set(""), self.root.focus_set()))
+        page.keys['slash'] = search.focus_set
+        self.home_search.trace_add("write", lambda *args: self.filter_home())
+
+        # Only HOME_ROWS buttons exist, however many call types there are; scrolling
+        # and searching relabel them instead of creating one button per call type.
+        list_frame = ttk.Frame(page.frame, style='Custom.TFrame')
+        list_frame.pack(fill=tk.BOTH, expand=True)
+        self.home_scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self.scroll_home)
+        self.home_scrollbar.pack(side="right", fill="y")
+        for i in range(HOME_ROWS):
+            btn = ttk.Button(list_frame, command=lambda i=i: self.open_home_slot(i), style='Accent.TButton')
             btn.pack(fill=tk.X, padx=10, pady=5)
-            # Bind numerical key shortcut for this call type.
-            self.root.bind(f"<Key-{i}>", lambda event, btn=btn: btn.invoke())
+            for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+                btn.bind(sequence, self.on_home_wheel)
+            self.home_slots.append(btn)
+            # Numerical key shortcut for the call type shown in this slot.
+            page.bind_key(str(i + 1), btn)
+        self.render_home()
+
+        search_tasks_btn = ttk.Button(page.frame, text="Search Tasks (Ctrl+F)",
+                                      command=self.show_search_page, style='Accent.TButton')
+        search_tasks_btn.pack(fill=tk.X, padx=10, pady=(10, 0))
+
+        library_frame = ttk.Frame(page.frame, style='Custom.TFrame')
+        library_frame.pack(fill=tk.X, padx=10, pady=(10, 0))
+        import_btn = ttk.Button(library_frame, text="Import Tasks", command=self.import_library, style='Accent.TButton')
+        import_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
+        export_btn = ttk.Button(library_frame, text="Export Tasks", command=self.export_library, style='Accent.TButton')
+        export_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
+
+    def filter_home(self):
+        query = self.home_search.get().strip().lower()
+        self.home_matches = [ct for label, ct in self.home_index if query in label]
+        self.home_offset = 0
+        self.render_home()
+
+    def render_home(self):
+        # Relabel the slot buttons for the visible window of matching call types.
+        matches = self.home_matches
+        self.home_offset = max(0, min(self.home_offset, len(matches) - HOME_ROWS))
+        for i, btn in enumerate(self.home_slots):
+            index = self.home_offset + i
+            if index < len(matches):
+                btn.configure(text=f"{i + 1}. {self.definitions.label(matches[index])} Call")
+                # Hidden slots are always the last ones, so re-packing keeps their order.
+                if not btn.winfo_manager():
+                    btn.pack(fill=tk.X, padx=10, pady=5)
+            elif btn.winfo_manager():
+                btn.pack_forget()
+        if matches:
+            self.home_scrollbar.set(self.home_offset / len(matches),
+                                    min(1.0, (self.home_offset + HOME_ROWS) / len(matches)))
+        else:
+            self.home_scrollbar.set(0.0, 1.0)
+
+    def scroll_home(self, action, amount, unit=None):
+        # Scrollbar command: ('moveto', fraction) or ('scroll', n, 'units' or 'pages').
+        if action == 'moveto':
+            self.home_offset = int(float(amount) * len(self.home_matches))
+        else:
+            self.home_offset += int(amount) * (HOME_ROWS if unit == 'pages' else 1)
+        self.render_home()
+
+    def on_home_wheel(self, event):
+        self.scroll_home('scroll', -1 if event.num == 4 or event.delta > 0 else 1, 'units')
+
+    def open_home_slot(self, slot):
+        index = self.home_offset + slot
+        if index < len(self.home_matches):
+            # Leave the search box, which on_key ignores, so the next page's shortcuts work.
+            self.root.focus_set()
+            self.show_call_sub_menu(self.home_matches[index])
     
+    def show_search_page(self):
+        self.finish_startup()
+        if self.task_index is None:
+            from search import TaskIndex
+            self.task_index = TaskIndex(self.model)
+            self.task_index.build()
+        self.show_page((None, 'search'), self.build_search_page)
+        self.search_entry.focus_set()
+        self.run_search()
+
+    def build_search_page(self, page):
+        title = ttk.Label(page.frame, text="Search Tasks", style='Title.TLabel')
+        title.pack(pady=(0, 20))
+
+        # Results are refreshed on every keystroke; Enter opens the selected (or first) match.
+        self.search_entry = ttk.Entry(page.frame, textvariable=self.search_query, style='Custom.TEntry')
+        self.search_entry.pack(fill=tk.X, padx=10, pady=(0, 10))
+        self.search_entry.bind("<Return>", lambda event: self.open_search_result())
+        self.search_entry.bind("<Escape>", lambda event: (self.root.focus_set(), self.show_home_page()))
+        self.search_entry.bind("<Down>", lambda event: self.move_search_selection(1))
+        self.search_entry.bind("<Up>", lambda event: self.move_search_selection(-1))
+        self.search_query.trace_add("write", lambda *args: self.run_search())
+
+        # A Listbox draws only the visible lines, so long result lists cost no widgets.
+        self.search_list = tk.Listbox(page.frame, activestyle='none', borderwidth=0,
+                                      highlightthickness=0, font=('Segoe UI', 10))
+        self.search_list.pack(fill=tk.BOTH, expand=True, padx=10)
+        self.search_list.bind("<Double-Button-1>", lambda event: self.open_search_result())
+        self.search_list.bind("<Return>", lambda event: self.open_search_result())
+
+        back_btn = ttk.Button(page.frame, text="Back", command=self.show_home_page, style='Accent.TButton')
+        back_btn.pack(pady=10)
+
+    def run_search(self):
+        if self.search_list is None:
+            return
+        self.search_results = self.task_index.search(self.search_query.get(), SEARCH_RESULTS)
+        self.search_list.delete(0, tk.END)
+        for call_type, checklist_type, text in self.search_results:
+            mode = self.definitions.mode_labels.get(checklist_type, checklist_type)
+            self.search_list.insert(tk.END, f"{text}  ({self.definitions.label(call_type)} - {mode})")
+        if self.search_results:
+            self.search_list.selection_set(0)
+
+    def move_search_selection(self, step):
+        if not self.search_results:
+            return
+        selection = self.search_list.curselection()
+        index = min(max((selection[0] if selection else -1) + step, 0), len(self.search_results) - 1)
+        self.search_list.selection_clear(0, tk.END)
+        self.search_list.selection_set(index)
+        self.search_list.see(index)
+
+    def open_search_result(self):
+        if not self.search_results:
+            return
+        selection = self.search_list.curselection()
+        call_type, checklist_type, text = self.search_results[selection[0] if selection else 0]
+        # Leave the search box, which on_key ignores, so the checklist's shortcuts work.
+        self.root.focus_set()
+        self.show_checklist_page(call_type, checklist_type)
+
+    def import_library(self):
+        # Bulk import from a JSON Lines or CSV file: one batch, one save, one re-render.
+        from tkinter import filedialog, messagebox
+        import library
+        self.finish_startup()
+        path = filedialog.askopenfilename(title="Import Tasks",
+                                          filetypes=[("Task libraries", "*.jsonl *.csv"), ("All files", "*")])
+        if not path:
+            return
+        try:
+            count, changed, errors = library.import_file(self.model, path)
+        except (OSError, UnicodeDecodeError) as e:
+            messagebox.showerror("Import Tasks", f"Could not read {path}:\n{e}")
+            return
+        for call_type, checklist_type in changed:
+            self.invalidate_page(call_type, checklist_type)
+        summary = f"Imported {count} tasks into {len(changed)} checklists."
+        if errors:
+            shown = "\n".join(f"line {line_no}: {error}" for line_no, error in errors[:10])
+            more = f"\n... and {len(errors) - 10} more" if len(errors) > 10 else ""
+            messagebox.showwarning("Import Tasks", f"{summary}\n{len(errors)} rows rejected:\n{shown}{more}")
+        else:
+            messagebox.showinfo("Import Tasks", summary)
+
+    def export_library(self):
+        from tkinter import filedialog, messagebox
+        import library
+        self.finish_startup()
+        path = filedialog.asksaveasfilename(title="Export Tasks", defaultextension=".jsonl",
+                                            filetypes=[("JSON Lines", "*.jsonl"), ("CSV", "*.csv")])
+        if not path:
+            return
+        try:
+            count = library.export_file(self.model, path)
+        except OSError as e:
+            messagebox.showerror("Export Tasks", f"Could not write {path}:\n{e}")
+            return
+        messagebox.showinfo("Export Tasks", f"Exported {count} tasks to {path}.")
+
     def show_call_sub_menu(self, call_type):
-        # Second page: choose between Voicemail or Start Call for the selected call type.
-        self.clear_container()
-        
+        # Second page: choose a checklist mode (e.g. Voicemail or Start Call) for the selected call type.
+        self.show_page((call_type, None), lambda page: self.build_call_sub_menu(page, call_type))
+
+    def build_call_sub_menu(self, page, call_type):
         # Display the selected call type
-        label = ttk.Label(self.container, text=f"Call Type: {call_type.capitalize()} Call", style='Header.TLabel')
+        label = ttk.Label(page.frame, text=f"Call Type: {self.definitions.label(call_type)} Call",
+                          style='Header.TLabel')
         label.pack(pady=(0, 20))
-        instruction = ttk.Label(self.container, text="Select an option:", style='Header.TLabel')
+        instruction = ttk.Label(page.frame, text="Select an option:", style='Header.TLabel')
         instruction.pack(pady=(0, 10))
         
-        # Create buttons for Voicemail and Start Call.
-        voicemail_btn = ttk.Button(
-            self.container,
-            text="Voicemail",
-            command=lambda: self.show_checklist_page(call_type, "voicemail"),
-            style='Accent.TButton'
-        )
-        voicemail_btn.pack(fill=tk.X, padx=10, pady=5)
-        
-        start_call_btn = ttk.Button(
-            self.container,
-            text="Start Call",
-            command=lambda: self.show_checklist_page(call_type, "start call"),
-            style='Accent.TButton'
-        )
-        start_call_btn.pack(fill=tk.X, padx=10, pady=5)
-        
-        # Bind keyboard shortcuts: 'v' for Voicemail and 's' for Start Call.
-        self.root.bind('<Key-v>', lambda event: voicemail_btn.invoke())
-        self.root.bind('<Key-V>', lambda event: voicemail_btn.invoke())
-        self.root.bind('<Key-s>', lambda event: start_call_btn.invoke())
-        self.root.bind('<Key-S>', lambda event: start_call_btn.invoke())
+        # One button per checklist mode, with its keyboard shortcut ('v' for Voicemail, 's' for Start Call).
+        for mode in self.definitions.modes:
+            btn = ttk.Button(
+                page.frame,
+                text=self.definitions.mode_labels[mode],
+                command=lambda mode=mode: self.show_checklist_page(call_type, mode),
+                style='Accent.TButton'
+            )
+            btn.pack(fill=tk.X, padx=10, pady=5)
+            if mode in self.definitions.mode_keys:
+                page.bind_key(self.definitions.mode_keys[mode], btn)
     
     def show_checklist_page(self, call_type, checklist_type):
+        self.finish_startup()
         self.current_call_type = call_type
         self.current_checklist_type = checklist_type
+        self.recorder.start(call_type, checklist_type)
 
-        # Reset the objection mini sub-checklist for a new call.
-        self.objection_subchecklist_data = None
+        page = self.show_page((call_type, checklist_type),
+                              lambda page: self.build_checklist_page(page, call_type, checklist_type))
+        if page.stale:
+            self.display_tasks()
 
-        self.clear_container()
-        
-        header_text = f"{call_type.capitalize()} - {checklist_type.capitalize()}"
-        header = ttk.Label(self.container, text=header_text, style='Title.TLabel')
+    def build_checklist_page(self, page, call_type, checklist_type):
+        header_text = f"{self.definitions.label(call_type)} - {self.definitions.mode_labels.get(checklist_type, checklist_type)}"
+        header = ttk.Label(page.frame, text=header_text, style='Title.TLabel')
         header.pack(pady=(0, 20))
         
-        self.tasks_frame = ttk.Frame(self.container, style='Custom.TFrame')
-        self.tasks_frame.pack(fill=tk.BOTH, expand=True)
-        
-        self.display_tasks()
+        tasks_frame = ttk.Frame(page.frame, style='Custom.TFrame')
+        tasks_frame.pack(fill=tk.BOTH, expand=True)
+        self.build_task_list(page, tasks_frame)
+        page.stale = True
         
         # New Call button: Resets the checklist for a new call.
-        new_call_btn = ttk.Button(self.container, text="New Call", command=self.new_call, style='Accent.TButton')
+        new_call_btn = ttk.Button(page.frame, text="New Call", command=self.new_call, style='Accent.TButton')
         new_call_btn.pack(pady=10)
         
-        # Bind the keyboard shortcut 'n' (or 'N') to invoke the New Call button.
-        self.root.bind("<Key-n>", lambda event: new_call_btn.invoke())
-        self.root.bind("<Key-N>", lambda event: new_call_btn.invoke())
+        # Keyboard shortcut 'n' (or 'N') invokes the New Call button.
+        page.bind_key('n', new_call_btn)
     
     def new_call(self):
-        # Reset the current checklist by marking all tasks as not done and clearing the objection mini checklist.
+        # Reset the current checklist by marking all tasks and sub-checklist items as not done.
         if self.current_call_type and self.current_checklist_type:
-            for task in self.checklists[self.current_call_type][self.current_checklist_type]['tasks']:
-                task['done'] = False
-            self.save_data()
-        # Reset the objection sub-checklist (if any)
-        self.objection_subchecklist_data = None
-        self.display_tasks()
+            self.recorder.end()
+            self.model.reset(self.current_call_type, self.current_checklist_type)
+            # The page is re-rendered, with its sub-checklists collapsed, when next shown.
+            page = self.pages.get((self.current_call_type, self.current_checklist_type))
+            if page is not None:
+                page.expanded.clear()
+        self.invalidate_page(self.current_call_type, self.current_checklist_type)
         self.show_home_page()
     
     def add_task(self, event=None):
         task_text = self.task_entry.get().strip()
         if not task_text or task_text == "Add a new task":
+            from tkinter import messagebox
             messagebox.showwarning("Warning", "Task cannot be empty")
             return
         
-        ct = self.current_call_type
-        cl = self.current_checklist_type
-        self.checklists[ct][cl]['tasks'].append({'text': task_text, 'done': False})
-        self.save_data()
+        self.model.add(self.current_call_type, self.current_checklist_type, task_text)
         self.display_tasks()
         self.task_entry.delete(0, tk.END)
     
-    def display_tasks(self):
-        for widget in self.tasks_frame.winfo_children():
-            widget.destroy()
+    def build_task_list(self, page, tasks_frame):
+        # Create the scrollable area once per checklist page; rows are added to it by display_tasks.
+        canvas = tk.Canvas(tasks_frame, bg=self.colors['bg'], highlightthickness=0)
+        scrollbar = ttk.Scrollbar(tasks_frame, orient="vertical", command=canvas.yview)
+        rows_frame = ttk.Frame(canvas, style='Custom.TFrame')
 
-        ct = self.current_call_type
-        cl = self.current_checklist_type
-        tasks = self.checklists[ct][cl]['tasks']
-
-        # Create a scrollable area for tasks.
-        canvas = tk.Canvas(self.tasks_frame, bg=self.colors['bg'], highlightthickness=0)
-        scrollbar = ttk.Scrollbar(self.tasks_frame, orient="vertical", command=canvas.yview)
-        scrollable_frame = ttk.Frame(canvas, style='Custom.TFrame')
-
-        scrollable_frame.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
+        rows_frame.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
+        canvas.create_window((0, 0), window=rows_frame, anchor="nw")
         canvas.configure(yscrollcommand=scrollbar.set)
 
         scrollbar.pack(side="right", fill="y")
         canvas.pack(side="left", fill="both", expand=True)
+        page.rows_frame = rows_frame
+
+    def display_tasks(self):
+        # Bring the retained rows in line with the task list: rows are only added or
+        # removed at the end, and each row restyles itself only if its state changed.
+        page = self.pages[(self.current_call_type, self.current_checklist_type)]
+        count = len(self.model.checklist(self.current_call_type, self.current_checklist_type).texts)
+        while len(page.task_rows) > count:
+            page.task_rows.pop().destroy()
+        for i in range(count):
+            if i == len(page.task_rows):
+                page.task_rows.append(TaskRow(self, page.rows_frame, i))
+            self.render_row(i)
+        page.stale = False
 
-        # Display each task.
-        for i, task in enumerate(tasks):
-            frame = ttk.Frame(scrollable_frame, style='Custom.TFrame')
-            frame.pack(fill=tk.X, pady=5)
-
-            # Special handling for Objection task in Sales, Reengagement, Support, or At-Risk (Start Call).
-            if ct in ["sales", "reengagement", "support", "at-risk"] and cl == "start call" and task['text'] == "Objection":
-                style_val = 'Accent.TButton'
-                if (self.objection_subchecklist_data is not None and all(item['done'] for item in self.objection_subchecklist_data)):
-                    style_val = 'Completed.TButton'
-                task_btn = ttk.Button(frame, text=task['text'],
-                                      command=lambda i=i: self.open_objection_subchecklist(), style=style_val)
-            else:
-                btn_style = 'Completed.TButton' if task['done'] else 'Accent.TButton'
-                task_btn = ttk.Button(frame, text=task['text'],
-                                      command=lambda i=i: self.toggle_task(i), style=btn_style)
-            task_btn.pack(side=tk.LEFT, fill=tk.X, expand=True)
-
-            edit_btn = ttk.Button(frame, text="✏️", command=lambda i=i: self.edit_task(i))
-            edit_btn.pack(side=tk.LEFT, padx=5)
-            edit_btn.config(width=2)
-
-            delete_btn = ttk.Button(frame, text="🗑️", command=lambda i=i: self.delete_task(i))
-            delete_btn.pack(side=tk.LEFT, padx=5)
-            delete_btn.config(width=2)
-
-            # If this is an Objection row and a mini sub-checklist exists, render it.
-            if ct in ["sales", "reengagement", "support", "at-risk"] and cl == "start call" and task['text'] == "Objection" and self.objection_subchecklist_data is not None:
-                self.render_objection_subchecklist(scrollable_frame)
+    def render_row(self, task_idx):
+        # Update the widgets of a single row from its task's current state. Items of a
+        # sub-checklist are only looked at (and get widgets) while it is expanded.
+        ct = self.current_call_type
+        cl = self.current_checklist_type
+        checklist = self.model.checklist(ct, cl)
+        page = self.pages[(ct, cl)]
+        sub_rows = None
+        if (task_idx,) in page.expanded and self.model.sub_checklist(ct, cl, (task_idx,)) is not None:
+            sub_rows = self.model.sub_rows(ct, cl, (task_idx,), page.expanded)
+        style_val = 'Completed.TButton' if self.model.is_task_done(ct, cl, task_idx) else 'Accent.TButton'
+        page.task_rows[task_idx].update(checklist.texts[task_idx], style_val, sub_rows)
     
     def toggle_task(self, task_idx):
         ct = self.current_call_type
         cl = self.current_checklist_type
-        # For Sales, Reengagement, Support, or At-Risk, Start Call Objection tasks trigger the mini sub-checklist.
-        if ct in ["sales", "reengagement", "support", "at-risk"] and cl == "start call" and self.checklists[ct][cl]['tasks'][task_idx]['text'] == "Objection":
-            self.open_objection_subchecklist()
+        # A task with a sub-checklist (e.g. Objection) expands or collapses it instead.
+        if self.model.sub_checklist(ct, cl, (task_idx,)) is not None:
+            self.toggle_expanded((task_idx,))
             return
-        else:
-            self.checklists[ct][cl]['tasks'][task_idx]['done'] = not self.checklists[ct][cl]['tasks'][task_idx]['done']
-            self.save_data()
-            self.display_tasks()
+        self.model.toggle(ct, cl, task_idx)
+        self.render_row(task_idx)
     
     def edit_task(self, task_idx):
         ct = self.current_call_type
         cl = self.current_checklist_type
-        task = self.checklists[ct][cl]['tasks'][task_idx]
-        new_text = simpledialog.askstring("Edit Task", "Edit the task:", initialvalue=task['text'])
+        text = self.model.checklist(ct, cl).texts[task_idx]
+        from tkinter import simpledialog
+        new_text = simpledialog.askstring("Edit Task", "Edit the task:", initialvalue=text)
         if new_text is not None and new_text.strip() != "":
-            task['text'] = new_text.strip()
-            self.save_data()
-            self.display_tasks()
+            self.model.edit(ct, cl, task_idx, new_text.strip())
+            page = self.pages[(ct, cl)]
+            page.expanded = {path for path in page.expanded if path[0] != task_idx}
+            self.render_row(task_idx)
     
     def delete_task(self, task_idx):
-        ct = self.current_call_type
-        cl = self.current_checklist_type
-        del self.checklists[ct][cl]['tasks'][task_idx]
-        self.save_data()
-        self.display_tasks()
-    
-    def open_objection_subchecklist(self):
-        # When Objection is clicked in Sales Start Call, initialize the mini sub-checklist if not already.
-        if self.objection_subchecklist_data is None:
-            self.objection_subchecklist_data = [
-                {'text': 'Listen & Acknowledge', 'done': False},
-                {'text': 'Clarify & Question', 'done': False},
-                {'text': 'Address the Objection', 'done': False},
-                {'text': 'Confirm & Close', 'done': False}
-            ]
-        # Refresh to show the objection sub-checklist
+        self.model.delete(self.current_call_type, self.current_checklist_type, task_idx)
+        self.pages[(self.current_call_type, self.current_checklist_type)].expanded.clear()
         self.display_tasks()
     
-    def render_objection_subchecklist(self, parent):
-        # Render the mini objection checklist vertically.
-        sub_frame = ttk.Frame(parent, style='Custom.TFrame')
-        sub_frame.pack(fill=tk.X, padx=20, pady=(0, 5))
-        for idx, subtask in enumerate(self.objection_subchecklist_data):
-            btn_style = 'Completed.TButton' if subtask['done'] else 'Accent.TButton'
-            btn = ttk.Button(sub_frame, text=subtask['text'], style=btn_style,
-                             command=lambda i=idx: self.toggle_objection_item(i))
-            btn.pack(fill=tk.X, padx=5, pady=2)
+    def toggle_expanded(self, path):
+        # Show or hide the sub-checklist owned by the task or sub-item at `path`.
+        page = self.pages[(self.current_call_type, self.current_checklist_type)]
+        if path in page.expanded:
+            page.expanded = {p for p in page.expanded if p[:len(path)] != path}
+        else:
+            page.expanded.add(path)
+        self.render_row(path[0])
     
-    def toggle_objection_item(self, index):
-        # Toggle the mini sub-checklist item.
-        self.objection_subchecklist_data[index]['done'] = not self.objection_subchecklist_data[index]['done']
-        self.display_tasks()
+    def click_sub_item(self, path):
+        # Sub-items with their own sub-checklist expand; the others are ticked, and the
+        # task row is restyled since its done state follows its items.
+        ct = self.current_call_type
+        cl = self.current_checklist_type
+        if self.model.sub_checklist(ct, cl, path) is not None:
+            self.toggle_expanded(path)
+            return
+        self.model.toggle_sub(ct, cl, path)
+        self.render_row(path[0])
+
+class Page:
+    """
+    A cached view: its frame, its keyboard shortcuts and, for checklist pages, its task rows.
+    """
+    def __init__(self, parent):
+        self.frame = ttk.Frame(parent, style='Custom.TFrame')
+        self.keys = {}
+        self.rows_frame = None
+        self.task_rows = []
+        # Paths of the tasks and sub-items whose sub-checklists are shown.
+        self.expanded = set()
+        # True when the checklist behind the page changed since its rows were last rendered.
+        self.stale = False
+
+    def bind_key(self, key, button):
+        self.keys[key.lower()] = button.invoke
+
+class TaskRow:
+    """
+    The widgets for one task line, kept alive between renders and restyled in place.
+    """
+    def __init__(self, app, parent, index):
+        self.app = app
+        self.index = index
+        self.frame = ttk.Frame(parent, style='Custom.TFrame')
+        self.frame.pack(fill=tk.X, pady=5)
+
+        self.task_btn = ttk.Button(self.frame, command=lambda: app.toggle_task(index))
+        self.task_btn.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        edit_btn = ttk.Button(self.frame, text="✏️", command=lambda: app.edit_task(index))
+        edit_btn.pack(side=tk.LEFT, padx=5)
+        edit_btn.config(width=2)
+
+        delete_btn = ttk.Button(self.frame, text="🗑️", command=lambda: app.delete_task(index))
+        delete_btn.pack(side=tk.LEFT, padx=5)
+        delete_btn.config(width=2)
+
+        # Expanded sub-checklist rendered under the row: one button per visible item,
+        # reused across renders, and the item path each button stands for.
+        self.sub_frame = None
+        self.sub_buttons = []
+        self.sub_paths = []
+        self.state = None
+
+    def update(self, text, style_val, sub_rows=None):
+        if self.state != (text, style_val):
+            self.task_btn.configure(text=text, style=style_val)
+            self.state = (text, style_val)
+        if not sub_rows:
+            if self.sub_frame is not None:
+                self.sub_frame.destroy()
+                self.sub_frame = None
+                self.sub_buttons = []
+                self.sub_paths = []
+            return
+        if self.sub_frame is None:
+            self.sub_frame = ttk.Frame(self.frame.master, style='Custom.TFrame')
+            self.sub_frame.pack(fill=tk.X, padx=20, pady=(0, 5), after=self.frame)
+        while len(self.sub_buttons) > len(sub_rows):
+            self.sub_buttons.pop()[0].destroy()
+        self.sub_paths = [path for path, *_ in sub_rows]
+        for idx, (path, depth, item_text, done, has_sub) in enumerate(sub_rows):
+            btn_style = 'Completed.TButton' if done else 'Accent.TButton'
+            label = f"▸ {item_text}" if has_sub else item_text
+            if idx == len(self.sub_buttons):
+                btn = ttk.Button(self.sub_frame, command=lambda i=idx: self.app.click_sub_item(self.sub_paths[i]))
+                btn.pack(fill=tk.X, pady=2)
+                self.sub_buttons.append([btn, None])
+            btn, state = self.sub_buttons[idx]
+            if state != (label, btn_style, depth):
+                btn.configure(text=label, style=btn_style)
+                btn.pack_configure(padx=(5 + 20 * depth, 5))
+                self.sub_buttons[idx][1] = (label, btn_style, depth)
+
+    def destroy(self):
+        if self.sub_frame is not None:
+            self.sub_frame.destroy()
+        self.frame.destroy()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Call centre checklist.")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="record action latencies and widget counts to FILE (Ctrl+Shift+D shows them)")
+    parser.add_argument("--metrics-interval", type=int, default=60, metavar="SECONDS")
+    parser.add_argument("--profile", metavar="ACTION",
+                        help="with --metrics, run the first ACTION (e.g. toggle_task or 'key n') under cProfile")
+    parser.add_argument("--server", metavar="URL", help="sync with a checklist server (see server.py)")
+    parser.add_argument("--agent", default=getpass.getuser(), help="agent name on the server (default: login name)")
+    args = parser.parse_args(argv)
 
-    def get_support_start_call_tasks(self):
-        """
-        Returns the default tasks for Support Call - Start Call.
-        """
-        return [
-            {'text': 'Rapport Question', 'done': False},
-            {'text': '2nd Open Question', 'done': False},
-            {'text': 'Followup on Support Given Previously', 'done': False},
-            {'text': 'Value Add Item', 'done': False},
-            {'text': 'Objection', 'done': False},
-            {'text': 'Further Support Required?', 'done': False},
-            {'text': 'Anything Else they want to Ask?', 'done': False},
-            {'text': 'Summarise Call', 'done': False},
-            {'text': 'Book Followup or Next Steps', 'done': False}
-        ]
-
-def main():
     root = tk.Tk()
-    app = ChecklistApp(root)
-    root.mainloop()
+    metrics = None
+    if args.metrics:
+        from metrics import Metrics
+        metrics = Metrics(root, args.metrics, args.metrics_interval, args.profile)
+    app = ChecklistApp(root, metrics, args.server, args.agent)
+    try:
+        root.mainloop()
+    finally:
+        # Covers exits that bypass the window close button (e.g. Ctrl+C).
+        app.shutdown()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,775 @@
+"""
+Benchmarks for the checklist app's hot paths. They drive ChecklistModel directly,
+so they run headless (no X server needed).
+
+    python bench.py            # run everything
+    python bench.py save model # run selected benchmarks
+"""
+import asyncio
+import csv
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import history
+import library
+import report
+import server
+from model import CHECKLIST_CHANGES, ChecklistModel, Definitions, read_files
+from search import TaskIndex
+from storage import FileLock, Journal, WriteBehindSaver, atomic_write, write_snapshot
+from sync import ServerSync
+
+DEFINITIONS = Definitions.load()
+SIZES = (10, 1000, 10000, 100000)
+CALL_TYPE_COUNTS = (6, 500)
+
+
+def make_call_types(n_types):
+    return [f"type {i}" for i in range(n_types)]
+
+
+def make_checklists(n_tasks, call_types=("sales", "support"), options=tuple(DEFINITIONS.modes)):
+    # Spread n_tasks evenly across every call type / checklist option.
+    per_list = max(1, n_tasks // (len(call_types) * len(options)))
+    data = {}
+    for ct in call_types:
+        data[ct] = {}
+        for cl in options:
+            data[ct][cl] = {
+                'daily_refresh': False,
+                'tasks': [{'text': f"{ct} {cl} task {i}", 'done': False} for i in range(per_list)],
+                'last_refresh': "2025-02-06"
+            }
+    return data
+
+
+def timed(fn, repeat):
+    # Returns the median wall time of `repeat` calls, in milliseconds.
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def bench_save(sizes=SIZES, repeat=20):
+    # Click-to-return latency: toggle one task and persist, old synchronous save vs write-behind.
+    print(f"{'tasks':>8} {'sync save ms':>14} {'write-behind ms':>16}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            model = ChecklistModel(call_types=["sales", "support"])
+            model.set_data(make_checklists(n))
+            path = os.path.join(tmp, f"sync_{n}.json")
+
+            def sync_click():
+                model.toggle("sales", "start call", 0)
+                with open(path, 'wb') as f:
+                    f.write(model.dumps())
+
+            saver = WriteBehindSaver(os.path.join(tmp, f"wb_{n}.json"), model.dumps, lock=model.lock)
+            model.listeners.append(lambda *change: saver.mark_dirty())
+
+            sync_ms = timed(sync_click, repeat)
+            wb_ms = timed(lambda: model.toggle("sales", "start call", 0), repeat)
+            saver.close()
+            print(f"{n:>8} {sync_ms:>14.3f} {wb_ms:>16.4f}")
+
+
+def bench_model(sizes=SIZES, type_counts=CALL_TYPE_COUNTS, repeat=5):
+    # Times every model operation across checklist sizes and numbers of call types.
+    print(f"{'types':>6} {'tasks':>8} {'load ms':>10} {'toggle ms':>10} {'add+del ms':>11} "
+          f"{'refresh ms':>11} {'save ms':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_types in type_counts:
+            call_types = make_call_types(n_types)
+            for n in sizes:
+                path = os.path.join(tmp, f"checklists_{n_types}_{n}.json")
+                with open(path, 'w') as f:
+                    json.dump(make_checklists(n, call_types), f, indent=4)
+                model = ChecklistModel(call_types=call_types)
+                ct, cl = call_types[0], "start call"
+
+                load_ms = timed(lambda: model.load(path), repeat)
+                toggle_ms = timed(lambda: model.toggle(ct, cl, 0), repeat * 20)
+
+                def add_delete():
+                    index = model.add(ct, cl, "Benchmark task")
+                    model.delete(ct, cl, index)
+
+                add_delete_ms = timed(add_delete, repeat * 20)
+
+                def stale_refresh():
+                    # Flag every checklist and make it stale, then time the reset itself.
+                    for ct in call_types:
+                        for option, checklist in model.call_type(ct).items():
+                            model.set_daily_refresh(ct, option, True)
+                            checklist.last_refresh = "2000-01-01"
+                    start = time.perf_counter()
+                    model.refresh_daily()
+                    return (time.perf_counter() - start) * 1000
+
+                refresh_ms = sorted(stale_refresh() for _ in range(repeat))[repeat // 2]
+                save_ms = timed(lambda: atomic_write(path, model.dumps()), repeat)
+                print(f"{n_types:>6} {n:>8} {load_ms:>10.2f} {toggle_ms:>10.4f} {add_delete_ms:>11.4f} "
+                      f"{refresh_ms:>11.2f} {save_ms:>10.2f}")
+
+
+def bench_daily(n_types=10000, flagged_counts=(0, 10, 100, 1000, 10000), repeat=5):
+    # The day-boundary reset with few or many checklists flagged daily_refresh in a large catalogue.
+    call_types = make_call_types(n_types)
+    print(f"{'types':>6} {'flagged':>8} {'refresh ms':>11}")
+    for n_flagged in flagged_counts:
+        data = make_checklists(n_types * 20, call_types)
+        for ct in call_types[:n_flagged]:
+            data[ct]["start call"]['daily_refresh'] = True
+        model = ChecklistModel(call_types=call_types)
+        model.set_data(data)
+        days = iter(range(repeat))
+
+        def next_day():
+            model.refresh_daily(f"2030-01-{next(days) + 1:02d}")
+
+        print(f"{n_types:>6} {n_flagged:>8} {timed(next_day, repeat):>11.3f}")
+
+
+def bench_history(row_counts=(100000, 1000000), repeat=5):
+    # Completion-rate query over a history of synthetic calls spread across the last year.
+    checklists = [(ct, cl, DEFINITIONS.templates[template]) for (ct, cl), template in DEFINITIONS.presets.items()]
+    print(f"{'task rows':>10} {'insert s':>9} {'completion ms':>14} {'objections ms':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_rows in row_counts:
+            path = os.path.join(tmp, f"history_{n_rows}.sqlite3")
+            rng = random.Random(n_rows)
+            now = time.time()
+            start = time.perf_counter()
+            store = history.HistoryStore(path, batch_size=5000)
+            rows, call_id = 0, 0
+            while rows < n_rows:
+                call_id += 1
+                ct, cl, texts = rng.choice(checklists)
+                started = now - rng.random() * 365 * history.DAY
+                store.put('calls', (call_id, ct, cl, started, started + 300))
+                for position, text in enumerate(texts):
+                    store.put('call_tasks', (call_id, position, text, ct, cl, started, rng.random() < 0.7))
+                    if text == "Objection":
+                        for item in ("Listen & Acknowledge", "Confirm & Close"):
+                            store.put('toggles', (call_id, position, text, item, 1, started + 60))
+                rows += len(texts)
+            store.close()
+            insert_s = time.perf_counter() - start
+
+            conn = sqlite3.connect(path)
+            completion_ms = timed(lambda: history.completion_rate(conn, "Great Ask for Sale", 30, now), repeat)
+            objections_ms = timed(lambda: history.objection_usage(conn, 30, now), repeat)
+            conn.close()
+            print(f"{rows:>10} {insert_s:>9.2f} {completion_ms:>14.3f} {objections_ms:>14.3f}")
+
+
+def bench_compact(type_counts=(6, 500, 5000)):
+    # Memory and file size of the old per-task dicts vs shared templates + done bitmasks.
+    templates = list(DEFINITIONS.templates.values())
+    print(f"{'types':>6} {'dicts MB':>9} {'compact MB':>11} {'dicts file KB':>14} {'compact file KB':>16}")
+    for n_types in type_counts:
+        call_types = make_call_types(n_types)
+
+        tracemalloc.start()
+        legacy = {ct: {cl: {'daily_refresh': False,
+                            'tasks': [{'text': text, 'done': False} for text in templates[(i + j) % len(templates)]],
+                            'last_refresh': "2025-02-06"}
+                       for j, cl in enumerate(DEFINITIONS.modes)}
+                  for i, ct in enumerate(call_types)}
+        legacy_mb = tracemalloc.get_traced_memory()[0] / 2 ** 20
+        tracemalloc.stop()
+        legacy_kb = len(json.dumps(legacy, indent=4)) / 1024
+
+        model = ChecklistModel(call_types=call_types)
+        tracemalloc.start()
+        model.set_data(legacy)
+        for ct in call_types:
+            model.call_type(ct)
+        compact_mb = tracemalloc.get_traced_memory()[0] / 2 ** 20
+        tracemalloc.stop()
+        compact_kb = len(model.dumps()) / 1024
+        print(f"{n_types:>6} {legacy_mb:>9.2f} {compact_mb:>11.2f} {legacy_kb:>14.1f} {compact_kb:>16.1f}")
+
+
+def bench_catalogue(type_counts=(10, 100, 1000, 10000), repeat=5):
+    # Startup (definitions + data file) and first opening of a checklist as the catalogue grows.
+    template_names = list(DEFINITIONS.templates)
+    print(f"{'types':>6} {'startup ms':>11} {'open ms':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_types in type_counts:
+            call_types = make_call_types(n_types)
+            definitions_path = os.path.join(tmp, f"calltypes_{n_types}.json")
+            with open(definitions_path, 'w') as f:
+                json.dump({
+                    'modes': [{'id': mode} for mode in DEFINITIONS.modes],
+                    'templates': {name: list(texts) for name, texts in DEFINITIONS.templates.items()},
+                    'call_types': [{'id': ct, 'templates': {mode: template_names[i % len(template_names)]
+                                                           for mode in DEFINITIONS.modes}}
+                                   for i, ct in enumerate(call_types)]
+                }, f)
+            data_path = os.path.join(tmp, f"checklists_{n_types}.json")
+            model = ChecklistModel(Definitions.load(definitions_path))
+            for ct in call_types:
+                model.call_type(ct)
+            atomic_write(data_path, model.dumps())
+
+            def startup():
+                startup.model = ChecklistModel(Definitions.load(definitions_path))
+                startup.model.load(data_path)
+
+            startup_ms = timed(startup, repeat)
+            open_ms = timed(lambda: startup.model.checklist(call_types[-1], DEFINITIONS.modes[-1]), 1)
+            print(f"{n_types:>6} {startup_ms:>11.2f} {open_ms:>8.3f}")
+
+
+def bench_search(sizes=SIZES, repeat=5):
+    # Per-keystroke latency of the task search while typing, plus index build and update costs.
+    words = sorted({word for texts in DEFINITIONS.templates.values() for text in texts
+                    for word in text.lower().split()})
+    rng = random.Random(0)
+    vocabulary = words + ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 10)))
+                          for _ in range(5000)]
+    queries = ["great ask for sale", "confirm next steps", "objectoin"]
+    print(f"{'tasks':>8} {'build ms':>9} {'keystroke ms':>13} {'worst ms':>9} {'add+edit+del ms':>16}")
+    for n in sizes:
+        call_types = make_call_types(max(1, n // 200))
+        data = make_checklists(n, call_types)
+        for options in data.values():
+            for checklist in options.values():
+                for task in checklist['tasks']:
+                    task['text'] = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(2, 6)))
+        model = ChecklistModel(call_types=call_types)
+        model.set_data(data)
+        index = TaskIndex(model)
+        start = time.perf_counter()
+        index.build()
+        build_ms = (time.perf_counter() - start) * 1000
+
+        samples = []
+        for query in queries:
+            for i in range(1, len(query) + 1):
+                samples.append(timed(lambda: index.search(query[:i]), repeat))
+        samples.sort()
+        ct, cl = call_types[0], "start call"
+
+        def add_edit_delete():
+            position = model.add(ct, cl, "Benchmark follow up task")
+            model.edit(ct, cl, position, "Benchmark follow up task edited")
+            model.delete(ct, cl, position)
+
+        update_ms = timed(add_edit_delete, repeat)
+        print(f"{n:>8} {build_ms:>9.1f} {samples[len(samples) // 2]:>13.4f} {samples[-1]:>9.4f} {update_ms:>16.4f}")
+
+
+def _stress_worker(path, worker, n_tasks):
+    # One app instance: add its own tasks to a shared checklist, toggling every other one twice
+    # more than the rest, while merging in the other workers' edits.
+    model = ChecklistModel(call_types=["sales"])
+    model.load(path)
+    saver = WriteBehindSaver(path, lambda: model.sync(path), delay=0.005,
+                             file_lock=FileLock(path + ".lock"),
+                             poll=lambda: model.reload_changed(path), poll_interval=0.01)
+    model.listeners.append(lambda kind, *change: kind != 'merge' and saver.mark_dirty())
+    rng = random.Random(worker)
+    texts = [f"worker {worker} task {i}" for i in range(n_tasks)]
+    for i, text in enumerate(texts):
+        model.add("sales", "start call", text)
+        for _ in range(1 if i % 2 == 0 else 3):
+            with model.lock:
+                # Merges from the writer thread can shift positions, so look the task up each time.
+                index = model.checklist("sales", "start call").texts.index(text)
+                model.toggle("sales", "start call", index)
+            time.sleep(rng.random() * 0.002)
+    saver.close()
+
+
+def bench_stress(n_procs=8, n_tasks=50):
+    # N processes hammer adds and toggles on one shared file; nothing may be lost.
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "checklists.json")
+        start = time.perf_counter()
+        procs = [multiprocessing.Process(target=_stress_worker, args=(path, w, n_tasks)) for w in range(n_procs)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        elapsed = time.perf_counter() - start
+
+        model = ChecklistModel(call_types=["sales"])
+        model.load(path)
+        checklist = model.checklist("sales", "start call")
+        texts = list(checklist.texts)
+        tasks = {t['text']: t['done'] for t in checklist.to_tasks()}
+        expected = {f"worker {w} task {i}": True for w in range(n_procs) for i in range(n_tasks)}
+        missing = [text for text in expected if text not in tasks]
+        wrong = [text for text in expected if text in tasks and tasks[text] is not True]
+        presets = DEFINITIONS.templates["sales start call"]
+        duplicated = [text for text in presets if texts.count(text) != 1]
+        print(f"{n_procs} processes x {n_tasks} tasks in {elapsed:.2f}s: "
+              f"{len(missing)} lost tasks, {len(wrong)} lost toggles, {len(duplicated)} duplicated presets")
+        if missing or wrong or duplicated:
+            raise SystemExit("lost updates")
+
+
+def _journaled(model, path, delay, limit):
+    # The app's persistence: each change journaled, the file rewritten when the journal is long.
+    journal = Journal(path + ".journal", limit=limit, checkpoint=lambda: saver.mark_dirty(urgent=True))
+
+    def snapshot():
+        with model.lock:
+            data = model.sync(path)
+            journal.rotate()
+        return data
+
+    saver = WriteBehindSaver(path, snapshot, delay=delay, file_lock=FileLock(path + ".lock"),
+                             written=lambda data: journal.commit())
+
+    def on_change(kind, call_type, checklist_type, index):
+        if kind == 'toggle' or kind in CHECKLIST_CHANGES:
+            journal.append(model.change_events(kind, call_type, checklist_type, index, with_base=True))
+            saver.mark_dirty()
+
+    model.listeners.append(on_change)
+    return journal, saver
+
+
+def _crash_worker(path, n_tasks, ready):
+    # Add and tick tasks, checkpointing now and then, and report each change once it
+    # is on disk, until killed.
+    model = ChecklistModel(call_types=["sales"])
+    journal = Journal(path + ".journal")
+    model.load(path, events=journal.read())
+    journal.close()
+    journal, saver = _journaled(model, path, delay=60, limit=4096)
+    for i in range(n_tasks):
+        index = model.add("sales", "start call", f"task {i}")
+        model.toggle("sales", "start call", index)
+        journal.flush()
+        ready.put(i)
+    time.sleep(60)
+
+
+def bench_journal(sizes=SIZES, repeat=20, n_tasks=300):
+    # Cost of persisting one toggle: rewriting the file vs appending to the journal; then
+    # replay at startup, and recovery of a process killed mid-work.
+    print(f"{'tasks':>8} {'rewrite ms':>11} {'journal ms':>11} {'replay 1000 ms':>15}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            path = os.path.join(tmp, f"checklists_{n}.json")
+            model = ChecklistModel(call_types=["sales", "support"])
+            model.set_data(make_checklists(n))
+            atomic_write(path, model.dumps())
+
+            def rewrite():
+                model.toggle("sales", "start call", 0)
+                atomic_write(path, model.dumps())
+
+            rewrite_ms = timed(rewrite, repeat)
+            journal, saver = _journaled(model, path, delay=60, limit=1 << 30)
+            journal_ms = timed(lambda: model.toggle("sales", "start call", 0), repeat)
+            journal.flush()
+            count = len(model.checklist("sales", "start call").texts)
+            for i in range(1000):
+                model.toggle("sales", "start call", i % count)
+            journal.flush()
+            events = journal.read()
+            replay_ms = timed(lambda: ChecklistModel(call_types=["sales", "support"]).load(path, events=events), 3)
+            model.listeners.clear()
+            saver.close()
+            journal.close()
+            print(f"{n:>8} {rewrite_ms:>11.3f} {journal_ms:>11.3f} {replay_ms:>15.2f}")
+
+        path = os.path.join(tmp, "checklists.json")
+        ready = multiprocessing.Queue()
+        proc = multiprocessing.Process(target=_crash_worker, args=(path, n_tasks, ready))
+        proc.start()
+        done = -1
+        while done < n_tasks // 2:
+            done = ready.get(timeout=30)
+        proc.kill()
+        proc.join()
+        while not ready.empty():
+            done = ready.get()
+        model = ChecklistModel(call_types=["sales"])
+        journal = Journal(path + ".journal")
+        model.load(path, events=journal.read())
+        journal.close()
+        checklist = model.checklist("sales", "start call")
+        tasks = {t['text']: t['done'] for t in checklist.to_tasks()}
+        lost = [i for i in range(done + 1) if tasks.get(f"task {i}") is not True]
+        print(f"killed after {done + 1} changes: {len(lost)} lost after replay")
+        if lost:
+            raise SystemExit("changes lost in a crash")
+
+        # A change journaled but not yet in the file is merged on replay with what another
+        # instance wrote in the meantime, instead of replacing it.
+        path = os.path.join(tmp, "shared.json")
+        first, second = ChecklistModel(call_types=["sales"]), ChecklistModel(call_types=["sales"])
+        first.load(path)
+        atomic_write(path, first.sync(path))
+        events = []
+        first.listeners.append(lambda *change: events.extend(first.change_events(*change, with_base=True)))
+        first.add("sales", "start call", "journaled task")
+        second.load(path)
+        second.toggle("sales", "start call", 0)
+        atomic_write(path, second.sync(path))
+        model = ChecklistModel(call_types=["sales"])
+        model.load(path, events=events)
+        checklist = model.checklist("sales", "start call")
+        kept = checklist.is_done(0) and "journaled task" in checklist.texts
+        print(f"replay over another instance's write: {'both changes kept' if kept else 'a change was lost'}")
+        if not kept:
+            raise SystemExit("replay overwrote another instance's change")
+
+
+def bench_subchecklists(sizes=(100, 1000, 10000), shapes=((4, 1), (100, 1), (3, 8)), repeat=5):
+    # Cost of one pass over every row (done state, sub-rows of expanded tasks) with a
+    # sub-checklist tree of `width` items per level and `depth` levels on every 10th task.
+    print(f"{'tasks':>6} {'width':>6} {'depth':>6} {'collapsed ms':>13} {'one expanded ms':>16}")
+    for width, depth in shapes:
+        subchecklists = {}
+        for level in range(depth):
+            child = f"level {level + 1}" if level + 1 < depth else None
+            subchecklists[f"level {level}"] = [{'text': f"step {level}.{i}", 'subchecklist': child} if child and i == 0
+                                               else f"step {level}.{i}" for i in range(width)]
+        for n in sizes:
+            texts = [f"Owner {i}" if i % 10 == 0 else f"Task {i}" for i in range(n)]
+            definitions = Definitions({
+                'modes': [{'id': "start call"}],
+                'templates': {'big': texts},
+                'call_types': [{'id': "sales", 'templates': {"start call": "big"},
+                                'subchecklists': {"start call": {text: "level 0" for text in texts[::10]}}}],
+                'subchecklists': subchecklists,
+            })
+            model = ChecklistModel(definitions)
+            model.set_data({})
+
+            def render(expanded):
+                for i in range(n):
+                    model.is_task_done("sales", "start call", i)
+                    if (i,) in expanded:
+                        model.sub_rows("sales", "start call", (i,), expanded)
+
+            # Expand the whole tree under the first task.
+            expanded = {(0,) + (0,) * level for level in range(depth)}
+            collapsed_ms = timed(lambda: render(set()), repeat)
+            expanded_ms = timed(lambda: render(expanded), repeat)
+            print(f"{n:>6} {width:>6} {depth:>6} {collapsed_ms:>13.3f} {expanded_ms:>16.3f}")
+
+
+def bench_library(row_counts=(1000, 50000), repeat=3):
+    # Import and export of task libraries: validation, one batched apply and one file write.
+    call_types = list(DEFINITIONS.call_types)
+    print(f"{'rows':>7} {'format':>6} {'import ms':>10} {'save ms':>8} {'export ms':>10} {'rejected':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_rows in row_counts:
+            rng = random.Random(n_rows)
+            records = [{'call_type': rng.choice(call_types), 'mode': rng.choice(DEFINITIONS.modes),
+                        'text': f"Campaign step {i}", 'done': i % 3 == 0} for i in range(n_rows)]
+            # One bad row in a hundred.
+            for record in records[::100]:
+                record['mode'] = "fax"
+            for fmt in ("jsonl", "csv"):
+                path = os.path.join(tmp, f"library_{n_rows}.{fmt}")
+                with open(path, 'w', newline='') as f:
+                    if fmt == "csv":
+                        writer = csv.DictWriter(f, ('call_type', 'mode', 'text', 'done'))
+                        writer.writeheader()
+                        writer.writerows(records)
+                    else:
+                        f.writelines(json.dumps(record) + "\n" for record in records)
+
+                def run_import():
+                    run_import.model = ChecklistModel()
+                    run_import.model.set_data({})
+                    run_import.result = library.import_file(run_import.model, path)
+
+                import_ms = timed(run_import, repeat)
+                model = run_import.model
+                data_path = os.path.join(tmp, "checklists.json")
+                save_ms = timed(lambda: atomic_write(data_path, model.dumps()), repeat)
+                export_path = os.path.join(tmp, f"export_{n_rows}.{fmt}")
+                export_ms = timed(lambda: library.export_file(model, export_path), repeat)
+                count, changed, errors = run_import.result
+                print(f"{n_rows:>7} {fmt:>6} {import_ms:>10.1f} {save_ms:>8.1f} {export_ms:>10.1f} {len(errors):>9}")
+                if count + len(errors) != n_rows:
+                    raise SystemExit("rows lost on import")
+
+
+# Run in a fresh interpreter by bench_startup: start the app in the current directory
+# and report when the home page is first exposed, and when the deferred startup is done.
+FIRST_FRAME = """
+import sys, tkinter as tk
+sys.path.insert(0, sys.argv[1])
+import app
+root = tk.Tk()
+ui = app.ChecklistApp(root)
+def exposed(event):
+    print("frame", flush=True)
+    root.after_idle(lambda: root.after_idle(done))
+def done():
+    print("started" if ui.started else "not started", flush=True)
+    ui.shutdown()
+    root.destroy()
+root.bind("<Expose>", exposed, add="+")
+root.mainloop()
+"""
+
+
+def _first_frame(cwd):
+    # Wall time from launching the interpreter to the first frame and to the end of
+    # startup, in milliseconds; None when there is no display to open a window on.
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-c", FIRST_FRAME, os.path.dirname(os.path.abspath(__file__))],
+                            cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    times = []
+    for line in proc.stdout:
+        times.append((time.perf_counter() - start) * 1000)
+        if line.strip() != "frame":
+            break
+    proc.wait()
+    return tuple(times) if len(times) == 2 else None
+
+
+def bench_startup(sizes=(1000, 10000, 100000), repeat=5):
+    # Reading the definitions and checklists at launch, parsed as JSON vs from the
+    # precompiled snapshot, then (with a display) time to the first frame of the app.
+    print(f"{'tasks':>7} {'json ms':>8} {'snapshot ms':>12} {'load ms':>8} {'first frame ms':>15} {'started ms':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            data_path = os.path.join(tmp, "checklists.json")
+            snapshot_path = data_path + ".snapshot"
+            model = ChecklistModel()
+            model.set_data(make_checklists(n))
+            atomic_write(data_path, model.dumps())
+            if os.path.exists(snapshot_path):
+                os.remove(snapshot_path)
+
+            json_ms = timed(lambda: read_files(data_path, snapshot_path), repeat)
+            sources, parsed, from_snapshot = read_files(data_path, snapshot_path)
+            write_snapshot(snapshot_path, sources, parsed)
+
+            def snapshot_start():
+                snapshot_start.result = read_files(data_path, snapshot_path)
+
+            snapshot_ms = timed(snapshot_start, repeat)
+            if not snapshot_start.result[2]:
+                raise SystemExit("snapshot rejected")
+
+            def load():
+                _, (definitions, data), _ = read_files(data_path, snapshot_path)
+                ChecklistModel(Definitions(definitions)).load(data_path, data)
+
+            load_ms = timed(load, repeat)
+            frames = [_first_frame(tmp) for _ in range(repeat)]
+            if None in frames:
+                frame_ms = started_ms = "n/a"
+            else:
+                frame_ms = f"{sorted(f[0] for f in frames)[repeat // 2]:.1f}"
+                started_ms = f"{sorted(f[1] for f in frames)[repeat // 2]:.1f}"
+            print(f"{n:>7} {json_ms:>8.2f} {snapshot_ms:>12.2f} {load_ms:>8.2f} {frame_ms:>15} {started_ms:>11}")
+
+
+def bench_report(desk_counts=(100, 1000, 3000), histories=100, calls=200):
+    # End-of-day report over a directory of desk files and history databases: a cold run
+    # with one worker and with a pool, then a re-run after a tenth of the desks changed.
+    print(f"{'desks':>6} {'histories':>10} {'1 worker s':>11} {'pool s':>7} {'rerun s':>8} {'read':>5}")
+    checklists = [(ct, cl, DEFINITIONS.templates[template]) for (ct, cl), template in DEFINITIONS.presets.items()]
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_desks in desk_counts:
+            directory = os.path.join(tmp, f"desks_{n_desks}")
+            os.makedirs(directory)
+            rng = random.Random(n_desks)
+            paths = []
+            for desk in range(n_desks):
+                model = ChecklistModel()
+                model.set_data({})
+                for ct in model.call_types:
+                    for cl in model.checklist_options:
+                        for i in range(len(model.checklist(ct, cl).texts)):
+                            if rng.random() < 0.6:
+                                model.toggle(ct, cl, i)
+                paths.append(os.path.join(directory, f"desk{desk}.json"))
+                atomic_write(paths[-1], model.dumps())
+            now = time.time()
+            for desk in range(min(histories, n_desks)):
+                store = history.HistoryStore(os.path.join(directory, f"desk{desk}.sqlite3"), batch_size=5000)
+                for call_id in range(calls):
+                    ct, cl, texts = rng.choice(checklists)
+                    started = now - rng.random() * history.DAY
+                    store.put('calls', (call_id, ct, cl, started, started + 300))
+                    for position, text in enumerate(texts):
+                        store.put('call_tasks', (call_id, position, text, ct, cl, started, rng.random() < 0.7))
+                        if text == "Objection":
+                            store.put('toggles', (call_id, position, text, "Listen & Acknowledge", 1, started + 60))
+                store.close()
+
+            serial_s = timed(lambda: report.run(directory, os.path.join(tmp, f"serial_{n_desks}"), workers=1), 1) / 1000
+            out = os.path.join(tmp, f"report_{n_desks}")
+            pool_s = timed(lambda: report.run(directory, out), 1) / 1000
+            for path in paths[::10]:
+                os.utime(path, ns=(time.time_ns(), time.time_ns()))
+
+            def rerun():
+                rerun.result = report.run(directory, out)
+
+            rerun_s = timed(rerun, 1) / 1000
+            files, read, errors = rerun.result
+            print(f"{n_desks:>6} {min(histories, n_desks):>10} {serial_s:>11.2f} {pool_s:>7.2f} {rerun_s:>8.2f} {read:>5}")
+            if errors:
+                raise SystemExit(f"{len(errors)} files failed: {errors[0]}")
+
+
+def _server_process(db, ports):
+    asyncio.run(server.serve("127.0.0.1", 0, db, ready=ports.put))
+
+
+async def _http(reader, writer, method, path, payload=None):
+    # One request on a keep-alive connection; returns (status, decoded JSON body).
+    body = b"" if payload is None else json.dumps(payload).encode()
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+                 + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def _simulated_agent(port, agent, n_actions, texts, latencies):
+    # An agent working through calls: toggle each task done, pull deltas now and then.
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    rng = random.Random(agent)
+    for i in range(n_actions):
+        index = i % len(texts)
+        start = time.perf_counter()
+        if i % 10 == 9:
+            status, _ = await _http(reader, writer, "GET", f"/agents/agent{agent}/state?since={i}")
+        else:
+            event = {'kind': 'toggle', 'call_type': "sales", 'checklist_type': "start call",
+                     'index': index, 'text': texts[index], 'done': True}
+            status, _ = await _http(reader, writer, "POST", f"/agents/agent{agent}/events", {'events': [event]})
+        latencies.append((time.perf_counter() - start) * 1000)
+        if status != 200:
+            raise SystemExit(f"agent {agent}: HTTP {status}")
+        await asyncio.sleep(rng.random() * 0.01)
+    writer.close()
+
+
+async def _load_test(port, n_agents, n_actions, texts):
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(_simulated_agent(port, agent, n_actions, texts, latencies) for agent in range(n_agents)))
+    elapsed = time.perf_counter() - start
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    states = [(await _http(reader, writer, "GET", f"/agents/agent{agent}/state"))[1] for agent in range(n_agents)]
+    writer.close()
+    return latencies, elapsed, states
+
+
+def bench_server(agent_counts=(10, 100, 300), n_actions=50):
+    # Simulated agents hammering a checklist server on localhost, then a real ServerSync client.
+    texts = DEFINITIONS.templates["sales start call"]
+    print(f"{'agents':>7} {'requests/s':>11} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_agents in agent_counts:
+            db = os.path.join(tmp, f"server_{n_agents}.sqlite3")
+            ports = multiprocessing.Queue()
+            proc = multiprocessing.Process(target=_server_process, args=(db, ports))
+            proc.start()
+            port = ports.get(timeout=30)
+            try:
+                latencies, elapsed, states = asyncio.run(_load_test(port, n_agents, n_actions, texts))
+            finally:
+                proc.terminate()
+                proc.join()
+            latencies.sort()
+            pct = lambda p: latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+            print(f"{n_agents:>7} {len(latencies) / elapsed:>11.0f} {pct(50):>8.2f} {pct(95):>8.2f} "
+                  f"{pct(99):>8.2f} {latencies[-1]:>8.2f}")
+            # Every agent ticked every task; the server state and its database must both say so.
+            expected = format((1 << len(texts)) - 1, 'x')
+            wrong = [state for state in states if state['types']["sales"]["start call"]['done'] != expected]
+            conn = sqlite3.connect(db)
+            stored = conn.execute("SELECT COUNT(*) FROM agents").fetchone()[0]
+            conn.close()
+            if wrong or stored != n_agents:
+                raise SystemExit(f"{len(wrong)} agents with lost toggles, {stored}/{n_agents} agents stored")
+
+        # A real client: its toggles reach the server and a pushed template reaches it.
+        ports = multiprocessing.Queue()
+        proc = multiprocessing.Process(target=_server_process, args=(os.path.join(tmp, "sync.sqlite3"), ports))
+        proc.start()
+        port = ports.get(timeout=30)
+        try:
+            model = ChecklistModel(call_types=["sales", "support"])
+            model.set_data({})
+            client = ServerSync(model, f"http://127.0.0.1:{port}", "desk 1", interval=0.05)
+            model.toggle("sales", "start call", 1)
+
+            async def push_template():
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                time.sleep(0.5)
+                await _http(reader, writer, "PUT", "/templates/voicemail", {'tasks': ["Leave a message"]})
+                _, state = await _http(reader, writer, "GET", "/agents/desk%201/state")
+                writer.close()
+                return state
+
+            state = asyncio.run(push_template())
+            time.sleep(0.5)
+            client.close()
+            synced = state['types']["sales"]["start call"]['done'] == "2"
+            pushed = model.checklist("support", "voicemail").texts == ("Leave a message",)
+            print(f"sync client: toggle on server {synced}, template pushed to client {pushed}")
+            if not (synced and pushed):
+                raise SystemExit("sync client out of step")
+        finally:
+            proc.terminate()
+            proc.join()
+
+
+BENCHMARKS = {
+    'save': bench_save,
+    'model': bench_model,
+    'daily': bench_daily,
+    'history': bench_history,
+    'stress': bench_stress,
+    'journal': bench_journal,
+    'compact': bench_compact,
+    'catalogue': bench_catalogue,
+    'search': bench_search,
+    'subchecklists': bench_subchecklists,
+    'library': bench_library,
+    'report': bench_report,
+    'server': bench_server,
+    'startup': bench_startup,
+}
+
+
+def main(argv):
+    names = argv or list(BENCHMARKS)
+    for name in names:
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,219 @@
+"""
+Per-call history kept in a local SQLite database.
+
+Every call session (call type, checklist mode, start/end time, task toggles and
+sub-checklist items such as the objection steps) is queued by CallRecorder and
+written in batches by HistoryStore's writer thread, so the Tk main thread never
+waits on SQLite.
+
+    python history.py completion "Great Ask for Sale" --days 30
+    python history.py objections --days 30
+"""
+import argparse
+import queue
+import secrets
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    id INTEGER PRIMARY KEY,
+    call_type TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    ended_at REAL
+);
+-- Final state of every task of a call. call_type and started_at are copied from
+-- calls so completion queries are answered from the covering index alone.
+CREATE TABLE IF NOT EXISTS call_tasks (
+    call_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    task TEXT NOT NULL,
+    call_type TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    done INTEGER NOT NULL,
+    PRIMARY KEY (call_id, position)
+) WITHOUT ROWID;
+-- Every toggle during a call; sub_item is the sub-checklist item, NULL for the task itself.
+CREATE TABLE IF NOT EXISTS toggles (
+    call_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    task TEXT NOT NULL,
+    sub_item TEXT,
+    done INTEGER NOT NULL,
+    at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS calls_type_started ON calls (call_type, started_at);
+CREATE INDEX IF NOT EXISTS call_tasks_task ON call_tasks (task, started_at, call_type, done);
+CREATE INDEX IF NOT EXISTS toggles_call ON toggles (call_id);
+CREATE INDEX IF NOT EXISTS toggles_sub_item ON toggles (at, sub_item, done) WHERE sub_item IS NOT NULL;
+"""
+
+DAY = 24 * 60 * 60
+
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class HistoryStore:
+    """
+    Writes queued history rows to SQLite in batches on a background thread.
+
+    Rows are grouped per table and inserted with executemany inside one transaction
+    per batch; a batch is flushed once `batch_size` rows are queued or `interval`
+    seconds have passed.
+    """
+    def __init__(self, path, batch_size=500, interval=1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.interval = interval
+        self.error = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, table, row):
+        self._queue.put((table, row))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        # The schema is created here too, so opening the store costs the caller nothing.
+        conn = connect(self.path)
+        conn.executescript(SCHEMA)
+        closing = False
+        while not closing:
+            batch = []
+            try:
+                item = self._queue.get()
+                deadline = time.monotonic() + self.interval
+                while item is not None:
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                closing = item is None
+            except queue.Empty:
+                pass
+            if batch:
+                self._write(conn, batch)
+        conn.close()
+
+    def _write(self, conn, batch):
+        by_table = {}
+        for table, row in batch:
+            by_table.setdefault(table, []).append(row)
+        try:
+            with conn:
+                for table, rows in by_table.items():
+                    self._insert(conn, table, rows)
+        except sqlite3.Error as e:
+            self.error = e
+
+    def _insert(self, conn, table, rows):
+        if table == 'calls':
+            conn.executemany("INSERT OR REPLACE INTO calls VALUES (?, ?, ?, ?, ?)", rows)
+        elif table == 'call_tasks':
+            conn.executemany("INSERT OR REPLACE INTO call_tasks VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        elif table == 'toggles':
+            conn.executemany("INSERT INTO toggles VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+
+class CallRecorder:
+    """
+    Turns checklist activity into history rows for a HistoryStore.
+
+    start() opens a call session for a checklist, the model listener records toggles
+    and sub-checklist items as they happen, and end() stores the final state of each
+    task (call it before the model resets the checklist for the next call).
+    """
+    def __init__(self, store, model):
+        self.store = store
+        self.model = model
+        self.call = None  # (call_id, call_type, mode, started_at) of the open session
+        model.listeners.append(self.on_change)
+
+    def start(self, call_type, checklist_type):
+        if self.call is not None:
+            if self.call[1:3] == (call_type, checklist_type):
+                return
+            self.end()
+        self.call = (secrets.randbits(62), call_type, checklist_type, time.time())
+        self.store.put('calls', self.call + (None,))
+
+    def end(self):
+        if self.call is None:
+            return
+        call_id, call_type, mode, started_at = self.call
+        self.call = None
+        self.store.put('calls', (call_id, call_type, mode, started_at, time.time()))
+        checklist = self.model.checklist(call_type, mode)
+        for position, text in enumerate(checklist.texts):
+            done = self.model.is_task_done(call_type, mode, position)
+            self.store.put('call_tasks', (call_id, position, text, call_type, mode, started_at, int(done)))
+
+    def on_change(self, kind, call_type, checklist_type, index):
+        if self.call is None or self.call[1:3] != (call_type, checklist_type):
+            return
+        if kind == 'toggle':
+            checklist = self.model.checklist(call_type, checklist_type)
+            self.store.put('toggles', (self.call[0], index, checklist.texts[index], None,
+                                       int(checklist.is_done(index)), time.time()))
+        elif kind == 'sub':
+            position = index[0]
+            item, done = self.model.sub_item(call_type, checklist_type, index)
+            text = self.model.checklist(call_type, checklist_type).texts[position]
+            self.store.put('toggles', (self.call[0], position, text, item, int(done), time.time()))
+
+
+def completion_rate(conn, task, days=30, now=None):
+    # Share of calls that finished with `task` done, per call type, over the last `days` days.
+    since = (now or time.time()) - days * DAY
+    rows = conn.execute(
+        "SELECT call_type, AVG(done), COUNT(*) FROM call_tasks "
+        "WHERE task = ? AND started_at >= ? GROUP BY call_type ORDER BY call_type",
+        (task, since))
+    return {call_type: (rate, calls) for call_type, rate, calls in rows}
+
+
+def objection_usage(conn, days=30, now=None):
+    # How often each sub-checklist item (the objection steps) was ticked over the last `days` days.
+    since = (now or time.time()) - days * DAY
+    rows = conn.execute(
+        "SELECT sub_item, COUNT(*) FROM toggles "
+        "WHERE sub_item IS NOT NULL AND at >= ? AND done = 1 GROUP BY sub_item ORDER BY 2 DESC",
+        (since,))
+    return dict(rows.fetchall())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the call history database.")
+    parser.add_argument("--db", default="history.sqlite3")
+    sub = parser.add_subparsers(dest="command", required=True)
+    completion = sub.add_parser("completion", help="completion rate of a task by call type")
+    completion.add_argument("task")
+    completion.add_argument("--days", type=int, default=30)
+    objections = sub.add_parser("objections", help="objection sub-step usage")
+    objections.add_argument("--days", type=int, default=30)
+    args = parser.parse_args(argv)
+
+    conn = connect(args.db)
+    if args.command == "completion":
+        for call_type, (rate, calls) in completion_rate(conn, args.task, args.days).items():
+            print(f"{call_type}\t{rate:.1%}\t{calls} calls")
+    else:
+        for sub_item, count in objection_usage(conn, args.days).items():
+            print(f"{sub_item}\t{count}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
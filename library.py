@@ -0,0 +1,198 @@
+"""
+Bulk import and export of checklist tasks as JSON Lines or CSV.
+
+Each record is one task: call_type, mode, text and optionally done (and position on
+export). Files are read and written one record at a time; an import is validated
+row by row and applied to the checklists in one batch, with one write of the file.
+
+    python library.py import campaign.csv
+    python library.py import campaign.jsonl --replace --strict
+    python library.py export library.csv --call-type sales
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+
+from model import ChecklistModel
+from storage import FileLock, atomic_write, orphaned_journals
+
+FIELDS = ('call_type', 'mode', 'position', 'text', 'done')
+TRUE = ('1', 'true', 'yes', 'y', 'x')
+FALSE = ('', '0', 'false', 'no', 'n')
+MAX_TEXT = 500
+
+
+def all_call_types(model):
+    # Defined call types first, then any others found in the data.
+    return list(dict.fromkeys(list(model.call_types) + list(model.checklists) + list(model.stored)))
+
+
+def file_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'csv' if os.path.splitext(path)[1].lower() == '.csv' else 'jsonl'
+
+
+def read_records(f, fmt):
+    # Yields (line number, record dict or None, error or None), reading one line at a time.
+    if fmt == 'csv':
+        reader = csv.DictReader(f)
+        try:
+            for record in reader:
+                yield reader.line_num, record, None
+        except csv.Error as e:
+            yield reader.line_num, None, f"invalid CSV: {e}"
+        return
+    for line_no, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f"invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_no, None, "expected a JSON object"
+            continue
+        yield line_no, record, None
+
+
+def parse_done(value):
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return False
+    text = str(value).strip().lower()
+    if text in TRUE:
+        return True
+    if text in FALSE:
+        return False
+    raise ValueError(f"done must be true or false, not {value!r}")
+
+
+def validate(records, model):
+    # Yields ((call_type, mode, text, done), None) for good rows and (None, (line, error)) for bad ones.
+    call_types = set(all_call_types(model))
+    modes = set(model.checklist_options)
+    for line_no, record, error in records:
+        if error is None:
+            call_type = record.get('call_type')
+            mode = record.get('mode')
+            text = record.get('text')
+            if call_type not in call_types:
+                error = f"unknown call type {call_type!r}"
+            elif mode not in modes:
+                error = f"unknown mode {mode!r}"
+            elif not isinstance(text, str) or not text.strip():
+                error = "text is missing"
+            elif len(text) > MAX_TEXT:
+                error = f"text is longer than {MAX_TEXT} characters"
+            else:
+                try:
+                    yield (call_type, mode, text.strip(), parse_done(record.get('done'))), None
+                    continue
+                except ValueError as e:
+                    error = str(e)
+        yield None, (line_no, error)
+
+
+def import_file(model, path, fmt=None, replace=False, strict=False):
+    """
+    Validates every record of `path` and applies the good ones to `model` in one batch.
+    Returns (rows applied, checklists changed, [(line, error)]); with `strict`, nothing
+    is applied when any row is bad.
+    """
+    rows, errors = [], []
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        for row, error in validate(read_records(f, file_format(path, fmt)), model):
+            if error is None:
+                rows.append(row)
+            else:
+                errors.append(error)
+    if strict and errors:
+        return 0, [], errors
+    changed = model.import_tasks(rows, replace) if rows else []
+    return len(rows), changed, errors
+
+
+def export_records(model, call_types=None):
+    # Yields one record per task, call type by call type.
+    for call_type in call_types or all_call_types(model):
+        for mode, checklist in model.call_type(call_type).items():
+            for position, text in enumerate(checklist.texts):
+                yield {'call_type': call_type, 'mode': mode, 'position': position,
+                       'text': text, 'done': checklist.is_done(position)}
+
+
+def export_file(model, path, fmt=None, call_types=None):
+    # Writes the records to a temporary file and moves it into place; returns the record count.
+    count = 0
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+            if file_format(path, fmt) == 'csv':
+                writer = csv.DictWriter(f, FIELDS)
+                writer.writeheader()
+                for record in export_records(model, call_types):
+                    writer.writerow(record)
+                    count += 1
+            else:
+                for record in export_records(model, call_types):
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    count += 1
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import or export checklist tasks (JSON Lines or CSV).")
+    parser.add_argument("--file", default="checklists.json", help="checklists data file")
+    parser.add_argument("--format", choices=("jsonl", "csv"), help="default: from the file extension")
+    sub = parser.add_subparsers(dest="command", required=True)
+    importer = sub.add_parser("import", help="add tasks from a library file")
+    importer.add_argument("path")
+    importer.add_argument("--replace", action="store_true", help="replace the tasks of each imported checklist")
+    importer.add_argument("--strict", action="store_true", help="import nothing if any row is invalid")
+    exporter = sub.add_parser("export", help="write every task to a library file")
+    exporter.add_argument("path")
+    exporter.add_argument("--call-type", action="append", dest="call_types")
+    args = parser.parse_args(argv)
+
+    model = ChecklistModel()
+    # Hold the data file's lock so running app instances merge the import rather than overwrite
+    # it. Changes journaled by instances that stopped before writing them are replayed first;
+    # an import writes them into the file and clears those journals, so they are not replayed
+    # over the imported checklists at the next start.
+    with FileLock(args.file + ".lock"):
+        journals = orphaned_journals(args.file + ".journal")
+        try:
+            events = [event for journal in journals for event in journal.read()]
+            model.load(args.file, events=events)
+            if args.command == "export":
+                count = export_file(model, args.path, args.format, args.call_types)
+                print(f"exported {count} tasks to {args.path}")
+                return
+            count, changed, errors = import_file(model, args.path, args.format, args.replace, args.strict)
+            if changed or events:
+                atomic_write(args.file, model.sync(args.file))
+                for journal in journals:
+                    journal.rotate()
+                    journal.commit()
+        finally:
+            for journal in journals:
+                journal.close()
+    for line_no, error in errors:
+        print(f"{args.path}:{line_no}: {error}", file=sys.stderr)
+    print(f"imported {count} tasks into {len(changed)} checklists, {len(errors)} rows rejected")
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
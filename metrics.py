@@ -0,0 +1,241 @@
+"""
+Opt-in instrumentation for the checklist app.
+
+Metrics times every user action from the key press or button command to the next
+idle Tk frame (after the redraw it caused), and the time spent in each instrumented
+method along the way. It also counts widgets created and destroyed, the live widget
+total and the Tcl callbacks registered on the root window, which grow when
+`root.bind` is called with fresh lambdas.
+
+    python app.py --metrics metrics.json --profile toggle_task
+
+Snapshots are written to the metrics file every `interval` seconds; Ctrl+Shift+D
+opens a debug panel with the same figures.
+"""
+import cProfile
+import json
+import math
+import os
+import pstats
+import threading
+import time
+import tkinter as tk
+
+from storage import atomic_write
+
+# Histogram buckets grow by 5%, so percentiles are within 5% of the true value.
+BUCKET_GROWTH = 1.05
+LOG_GROWTH = math.log(BUCKET_GROWTH)
+
+
+class Histogram:
+    """
+    Latencies in log-scaled buckets: constant memory however long the shift runs.
+    """
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, ms):
+        bucket = math.floor(math.log(max(ms, 1e-3)) / LOG_GROWTH)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.max = max(self.max, ms)
+
+    def percentile(self, p):
+        # Upper bound of the bucket holding the p-th percentile, in milliseconds.
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(BUCKET_GROWTH ** (bucket + 1), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'p50': round(self.percentile(50), 3),
+            'p95': round(self.percentile(95), 3),
+            'p99': round(self.percentile(99), 3),
+            'max': round(self.max, 3),
+        }
+
+
+class Metrics:
+    """
+    Per-action latency histograms, per-method timings and widget counts for one app.
+
+    begin() opens an action (nested calls made while one is open only count as
+    stages); the action ends at the next idle callback of `root`. When
+    `profile_action` is set, the first such action runs under cProfile and its stats
+    are written next to the metrics file.
+    """
+    def __init__(self, root, path="metrics.json", interval=60, profile_action=None):
+        self.root = root
+        self.path = path
+        self.interval = interval
+        self.profile_action = profile_action
+        self.started = time.time()
+        self.actions = {}
+        self.stages = {}
+        self.created = 0
+        self.destroyed = 0
+        self.action = None  # (name, start) of the action in progress
+        self.profiler = None
+        self.profile_path = None
+        self.profile_text = ""
+        self.panel = None
+        self._original_setup = tk.BaseWidget._setup
+        self._original_destroy = tk.BaseWidget.destroy
+        self._patch_widgets()
+        self.root.after(self.interval * 1000, self.write_periodically)
+
+    def _patch_widgets(self):
+        # Count every widget created or destroyed, ttk ones included.
+        setup, destroy = self._original_setup, self._original_destroy
+        metrics = self
+
+        def counted_setup(widget, master, cnf):
+            metrics.created += 1
+            setup(widget, master, cnf)
+
+        def counted_destroy(widget):
+            metrics.destroyed += 1
+            destroy(widget)
+
+        tk.BaseWidget._setup = counted_setup
+        tk.BaseWidget.destroy = counted_destroy
+
+    def close(self):
+        tk.BaseWidget._setup = self._original_setup
+        tk.BaseWidget.destroy = self._original_destroy
+        try:
+            self.write()
+        except tk.TclError:
+            pass  # The window is already gone; the last periodic snapshot stands.
+
+    def begin(self, name):
+        # Returns True if this call opened the action, False if one was already running.
+        if self.action is not None:
+            return False
+        self.action = (name, time.perf_counter())
+        if name == self.profile_action and self.profiler is None and self.profile_path is None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.root.after_idle(self.finish)
+        return True
+
+    def finish(self):
+        name, start = self.action
+        self.action = None
+        self.actions.setdefault(name, Histogram()).add((time.perf_counter() - start) * 1000)
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profile_path = os.path.splitext(self.path)[0] + f".{name}.prof"
+            self.profiler.dump_stats(self.profile_path)
+            lines = []
+            stats = pstats.Stats(self.profile_path, stream=_Lines(lines))
+            stats.sort_stats('cumulative').print_stats(15)
+            self.profile_text = "".join(lines)
+            self.profiler = None
+
+    def wrap(self, name, fn):
+        # Time every call of `fn` as stage `name`, opening an action if none is running.
+        # Calls from other threads (e.g. saves prompted by the sync thread) are not user
+        # actions, and Tk may only be used from the main thread, so they go untimed.
+        def instrumented(*args, **kwargs):
+            if threading.current_thread() is not threading.main_thread():
+                return fn(*args, **kwargs)
+            self.begin(name)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.stages.setdefault(name, Histogram()).add((time.perf_counter() - start) * 1000)
+        return instrumented
+
+    def instrument(self, obj, names):
+        # Replace the bound methods `names` of `obj` with timed versions.
+        for name in names:
+            setattr(obj, name, self.wrap(name, getattr(obj, name)))
+
+    def live_widgets(self):
+        count, stack = 0, [self.root]
+        while stack:
+            children = stack.pop().winfo_children()
+            count += len(children)
+            stack.extend(children)
+        return count
+
+    def snapshot(self):
+        return {
+            'uptime_s': round(time.time() - self.started, 1),
+            'actions': {name: h.summary() for name, h in sorted(self.actions.items())},
+            'stages': {name: h.summary() for name, h in sorted(self.stages.items())},
+            'widgets': {
+                'created': self.created,
+                'destroyed': self.destroyed,
+                'live': self.live_widgets(),
+            },
+            # Python callbacks registered on the root window; steady growth means a
+            # binding leak (e.g. root.bind called again with a new lambda on every render).
+            'root_callbacks': len(self.root._tclCommands or ()),
+            'tcl_commands': len(self.root.tk.call('info', 'commands')),
+            'profile': self.profile_path,
+        }
+
+    def write(self):
+        atomic_write(self.path, json.dumps(self.snapshot(), indent=2).encode())
+
+    def write_periodically(self):
+        try:
+            self.write()
+        except OSError:
+            pass
+        self.root.after(self.interval * 1000, self.write_periodically)
+
+    def toggle_panel(self):
+        # The hidden debug panel: a small window refreshed every second while open.
+        if self.panel is not None:
+            self.panel.destroy()
+            self.panel = None
+            return
+        self.panel = tk.Toplevel(self.root)
+        self.panel.title("Metrics")
+        self.panel.protocol("WM_DELETE_WINDOW", self.toggle_panel)
+        text = tk.Text(self.panel, width=70, height=40, font=('Courier', 9))
+        text.pack(fill=tk.BOTH, expand=True)
+        self.refresh_panel(self.panel, text)
+
+    def refresh_panel(self, panel, text):
+        if self.panel is not panel:
+            return
+        snapshot = self.snapshot()
+        lines = [f"uptime {snapshot['uptime_s']}s", "",
+                 f"{'action':<24}{'n':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"]
+        for title in ('actions', 'stages'):
+            if title == 'stages':
+                lines += ["", f"{'stage':<24}"]
+            for name, h in snapshot[title].items():
+                lines.append(f"{name:<24}{h['count']:>6}{h['p50']:>9.2f}{h['p95']:>9.2f}{h['p99']:>9.2f}{h['max']:>9.2f}")
+        widgets = snapshot['widgets']
+        lines += ["", f"widgets created {widgets['created']}, destroyed {widgets['destroyed']}, live {widgets['live']}",
+                  f"root callbacks {snapshot['root_callbacks']}, tcl commands {snapshot['tcl_commands']}"]
+        if self.profile_text:
+            lines += ["", self.profile_text]
+        text.delete("1.0", tk.END)
+        text.insert(tk.END, "\n".join(lines))
+        panel.after(1000, lambda: self.refresh_panel(panel, text))
+
+
+class _Lines:
+    # Minimal stream collecting what pstats prints.
+    def __init__(self, lines):
+        self.lines = lines
+
+    def write(self, s):
+        self.lines.append(s)
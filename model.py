@@ -0,0 +1,848 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+from datetime import date
+
+from storage import atomic_write, file_stamp, read_snapshot
+
+# Call types, checklist modes and their task templates are defined in this file.
+DEFINITIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "calltypes.json")
+
+# Change kinds that are written to checklists.json. 'server' and 'template' changes
+# come from a checklist server (see server.py and sync.py).
+PERSISTED_CHANGES = ('toggle', 'sub', 'add', 'edit', 'delete', 'reset', 'refresh', 'import', 'server', 'template')
+
+# Changes made here that change_events() describes as whole checklists; toggles are
+# described as small deltas. Used for the journal and for pushes to a checklist server.
+CHECKLIST_CHANGES = ('sub', 'add', 'edit', 'delete', 'reset', 'refresh', 'import')
+
+# Items of the objection sub-checklist for definition files that predate "subchecklists".
+OBJECTION_ITEMS = ['Listen & Acknowledge', 'Clarify & Question', 'Address the Objection', 'Confirm & Close']
+
+
+class Definitions:
+    """
+    Call types, checklist modes and task templates, as read from a definitions file.
+
+    Template texts are interned tuples shared by every checklist built from them, so
+    a template can never be changed through one of the checklists using it.
+    """
+    def __init__(self, data):
+        self.modes = [mode['id'] for mode in data.get('modes', [])]
+        self.mode_labels = {mode['id']: mode.get('label', mode['id'].title()) for mode in data.get('modes', [])}
+        self.mode_keys = {mode['id']: mode['key'] for mode in data.get('modes', []) if mode.get('key')}
+        self.templates = {name: tuple(sys.intern(text) for text in texts)
+                          for name, texts in data.get('templates', {}).items()}
+        # Sub-checklists by name, as (text, name of the item's own sub-checklist or None) items.
+        self.subchecklists = {}
+        for name, items in data.get('subchecklists', {}).items():
+            self.subchecklists[name] = tuple(
+                (sys.intern(item), None) if isinstance(item, str) else (sys.intern(item['text']), item.get('subchecklist'))
+                for item in items)
+        self.call_types = []
+        self.labels = {}
+        # Preset template for each (call type, mode), and per (call type, mode) the
+        # sub-checklist owned by a task, keyed by the task's text.
+        self.presets = {}
+        self.task_subchecklists = {}
+        for entry in data.get('call_types', []):
+            ct = entry['id']
+            self.call_types.append(ct)
+            self.labels[ct] = entry.get('label', ct.capitalize())
+            for mode, template in entry.get('templates', {}).items():
+                self.presets[(ct, mode)] = template
+            for mode, tasks in entry.get('subchecklists', {}).items():
+                self.task_subchecklists.setdefault((ct, mode), {}).update(tasks)
+            # Older files: "objection": [modes] gives those modes' Objection task the objection sub-checklist.
+            for mode in entry.get('objection', []):
+                self.task_subchecklists.setdefault((ct, mode), {})["Objection"] = "objection"
+                self.subchecklists.setdefault("objection", tuple((text, None) for text in OBJECTION_ITEMS))
+        self.check_subchecklists()
+
+    def check_subchecklists(self):
+        # Every sub-checklist named must exist, and none may contain itself.
+        def visit(name, parents):
+            if name not in self.subchecklists:
+                raise ValueError(f"unknown sub-checklist {name!r}")
+            if name in parents:
+                raise ValueError(f"sub-checklist {name!r} contains itself")
+            for _, child in self.subchecklists[name]:
+                if child is not None:
+                    visit(child, parents | {name})
+
+        for tasks in self.task_subchecklists.values():
+            for name in tasks.values():
+                visit(name, frozenset())
+
+    @classmethod
+    def load(cls, path=DEFINITIONS_FILE):
+        with open(path, 'r') as f:
+            return cls(json.load(f))
+
+    def label(self, call_type):
+        return self.labels.get(call_type, call_type.capitalize())
+
+
+def parse_data(raw, path=None):
+    # A checklists file's content; an empty or damaged file counts as no data. Given the
+    # file's `path`, a damaged one is first kept as <path>.corrupt, so that the next save
+    # cannot wipe out what it held; the journal restores the changes since the last good write.
+    try:
+        return json.loads(raw) if raw else {}
+    except ValueError:
+        if path is not None:
+            atomic_write(path + ".corrupt", raw)
+        return {}
+
+
+def read_files(data_path, snapshot_path, definitions_path=DEFINITIONS_FILE):
+    """
+    The definitions and checklists files as ([definitions bytes, data bytes],
+    (definitions, data), from_snapshot). The parsed pair comes from the precompiled
+    snapshot when it was made from these exact bytes; otherwise both are parsed as JSON.
+    """
+    with open(definitions_path, 'rb') as f:
+        definitions = f.read()
+    try:
+        with open(data_path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        data = b""
+    sources = [definitions, data]
+    parsed = read_snapshot(snapshot_path, sources)
+    if parsed is not None:
+        return sources, parsed, True
+    return sources, (json.loads(definitions), parse_data(data, data_path)), False
+
+
+def bits_to_int(flags):
+    # Bitmask with bit i set when flags[i] is true; built from a binary string, which is linear in len(flags).
+    digits = ''.join('1' if flag else '0' for flag in reversed(flags))
+    return int(digits, 2) if digits else 0
+
+
+class Checklist:
+    """
+    Run state of one checklist: the task texts of a shared template plus a bitmask
+    of done tasks, where bit i is set when task i is done.
+
+    Adding, editing or deleting a task first copies the template's texts into an
+    overlay owned by this checklist, so the template itself is never changed.
+    Sub-checklist state is kept in `subs`: for the task (or sub-item) at a path of
+    positions, such as (3,) or (3, 1), a bitmask of the done items under it.
+    Serialised as {'template', 'done' (hex bitmask), 'daily_refresh', 'last_refresh'}
+    plus 'tasks' (the overlay texts) once the checklist has been edited and 'subs'
+    ({"3.1": hex bitmask}) once a sub-item has been ticked.
+    """
+    __slots__ = ('template', 'shared', 'overlay', 'done', 'subs', 'daily_refresh', 'last_refresh')
+
+    def __init__(self, template=None, shared=(), overlay=None, done=0, daily_refresh=False, last_refresh='',
+                 subs=None):
+        self.template = template
+        self.shared = shared
+        self.overlay = overlay
+        self.done = done
+        self.subs = subs or {}
+        self.daily_refresh = daily_refresh
+        self.last_refresh = last_refresh
+
+    @classmethod
+    def from_json(cls, data, templates, preset=None, versions=None):
+        """
+        Reads both the compact form and the older {'tasks': [{'text', 'done'}]} form.
+        `versions` holds the template texts saved with the data, by the key in the
+        checklist's 'version'; when the current template differs, the done state is
+        carried over to the current template by task text.
+        """
+        template = data.get('template', preset)
+        shared = templates.get(template, ()) if template else ()
+        tasks = data.get('tasks')
+        subs = {}
+        if 'done' in data:
+            overlay = None if tasks is None else [sys.intern(text) for text in tasks]
+            done = int(data['done'], 16)
+            for key, bits in data.get('subs', {}).items():
+                subs[tuple(int(i) for i in key.split('.'))] = int(bits, 16)
+            saved = versions.get(data.get('version')) if versions and overlay is None else None
+            if saved is not None and saved != shared:
+                if template not in templates:
+                    shared = saved  # A template no longer defined: keep the saved copy.
+                else:
+                    done, subs = remap_state(saved, shared, done, subs)
+        else:
+            tasks = tasks or []
+            texts = tuple(sys.intern(task['text']) for task in tasks)
+            if texts and texts != shared:
+                # Old data does not name its template; share any template with the same tasks.
+                template = next((name for name, candidate in templates.items() if candidate == texts), template)
+                shared = templates.get(template, ()) if template else ()
+            overlay = None if texts == shared else list(texts)
+            done = bits_to_int([task.get('done') for task in tasks])
+            # The expanded form keeps each task's sub-checklist state with the task.
+            for i, task in enumerate(tasks):
+                for key, bits in task.get('subs', {}).items():
+                    subs[(i,) + tuple(int(j) for j in key.split('.') if j)] = int(bits, 16)
+        return cls(template, shared, overlay, done, data.get('daily_refresh', False), data.get('last_refresh', ''),
+                   subs)
+
+    @property
+    def texts(self):
+        return self.shared if self.overlay is None else self.overlay
+
+    def use_template(self, template, templates):
+        self.template = template
+        self.shared = templates.get(template, ())
+        self.overlay = None
+        self.clear()
+
+    def is_done(self, index):
+        return (self.done >> index) & 1 == 1
+
+    def toggle(self, index):
+        self.done ^= 1 << index
+        return self.is_done(index)
+
+    def clear(self):
+        # Untick every task and sub-item (a new call or a daily refresh).
+        self.done = 0
+        self.subs = {}
+
+    def drop_subs(self, index, shift=False):
+        # Forget the sub-checklist state of task `index`; with `shift`, the task itself
+        # is gone and the state of the tasks after it moves down one position.
+        subs = {}
+        for path, bits in self.subs.items():
+            if path[0] < index:
+                subs[path] = bits
+            elif path[0] > index:
+                subs[(path[0] - 1,) + path[1:] if shift else path] = bits
+        self.subs = subs
+
+    def own_texts(self):
+        # Copy on write: give this checklist its own texts before changing them.
+        if self.overlay is None:
+            self.overlay = list(self.shared)
+        return self.overlay
+
+    def add(self, text):
+        texts = self.own_texts()
+        texts.append(sys.intern(text))
+        return len(texts) - 1
+
+    def edit(self, index, text):
+        texts = self.own_texts()
+        if texts[index] != text:
+            # A renamed task may own a different sub-checklist, or none.
+            self.drop_subs(index)
+        texts[index] = sys.intern(text)
+
+    def delete(self, index):
+        del self.own_texts()[index]
+        # Drop bit `index` and shift the higher bits down by one.
+        low = self.done & ((1 << index) - 1)
+        self.done = low | ((self.done >> (index + 1)) << index)
+        if self.subs:
+            self.drop_subs(index, shift=True)
+
+    def to_json(self):
+        data = {
+            'daily_refresh': self.daily_refresh,
+            'last_refresh': self.last_refresh,
+            'template': self.template,
+            'done': format(self.done, 'x')
+        }
+        if self.overlay is not None:
+            data['tasks'] = list(self.overlay)
+        if self.subs:
+            data['subs'] = {'.'.join(map(str, path)): format(bits, 'x') for path, bits in self.subs.items()}
+        return data
+
+    def to_tasks(self):
+        # The expanded [{'text', 'done'}] list, as load_data used to build it, plus each
+        # task's sub-checklist state under 'subs' (paths relative to the task).
+        bits = format(self.done, 'b')[::-1]
+        tasks = [{'text': text, 'done': i < len(bits) and bits[i] == '1'} for i, text in enumerate(self.texts)]
+        for path, sub_bits in self.subs.items():
+            if path[0] < len(tasks):
+                tasks[path[0]].setdefault('subs', {})['.'.join(map(str, path[1:]))] = format(sub_bits, 'x')
+        return tasks
+
+
+def text_keys(texts):
+    # Identify tasks by their text, numbering repeats, so the same task can be
+    # matched up across copies edited by different app instances.
+    seen = {}
+    keys = []
+    for text in texts:
+        n = seen.get(text, 0)
+        seen[text] = n + 1
+        keys.append((text, n))
+    return keys
+
+
+def task_keys(tasks):
+    return text_keys(task['text'] for task in tasks)
+
+
+def remap_state(old, new, done, subs):
+    # Done bits and sub-checklist state kept for template texts `old`, moved to the
+    # positions of the same tasks in `new`; tasks no longer in `new` are dropped.
+    positions = {key: i for i, key in enumerate(text_keys(new))}
+    mapping = [positions.get(key) for key in text_keys(old)]
+    new_done = 0
+    for i, j in enumerate(mapping):
+        if j is not None and (done >> i) & 1:
+            new_done |= 1 << j
+    new_subs = {(mapping[path[0]],) + path[1:]: bits for path, bits in subs.items()
+                if path[0] < len(mapping) and mapping[path[0]] is not None}
+    return new_done, new_subs
+
+
+def template_version(texts):
+    # Content hash naming one version of a template's texts in a data file.
+    return hashlib.sha1("\n".join(texts).encode('utf-8')).hexdigest()[:16]
+
+
+def merge_tasks(base, local, remote):
+    # Three-way merge of task lists: keep the remote order, drop tasks deleted on
+    # either side, append tasks added here, and let whichever side changed a task's
+    # done flag or sub-checklist state since `base` win (this side on a tie).
+    base_tasks = dict(zip(task_keys(base), base))
+    local_tasks = dict(zip(task_keys(local), local))
+    remote_keys = task_keys(remote)
+    merged = []
+    for key, task in zip(remote_keys, remote):
+        mine = local_tasks.get(key)
+        if mine is None:
+            if key not in base_tasks:
+                merged.append(task)  # Added by the other instance.
+            continue  # Otherwise deleted here.
+        before = base_tasks.get(key)
+        if before is None or (mine['done'], mine.get('subs')) != (before['done'], before.get('subs')):
+            merged.append(mine)
+        else:
+            merged.append(task)
+    remote_set = set(remote_keys)
+    for key, task in local_tasks.items():
+        if key not in remote_set and key not in base_tasks:
+            merged.append(task)  # Added here.
+    return merged
+
+
+def merge_call_type(base, local, remote):
+    # Merge every checklist option of one call type; see merge_tasks.
+    merged = {}
+    for option in list(remote) + [o for o in local if o not in remote]:
+        theirs = remote.get(option)
+        mine = local.get(option)
+        before = base.get(option) or {}
+        if mine is None:
+            if option not in base:
+                merged[option] = theirs
+            continue
+        if theirs is None:
+            if option not in base:
+                merged[option] = mine
+            continue
+        checklist = {}
+        for field in ('daily_refresh', 'last_refresh', 'template'):
+            changed_here = mine.get(field) != before.get(field)
+            checklist[field] = mine.get(field) if changed_here else theirs.get(field)
+        checklist['tasks'] = merge_tasks(before.get('tasks', []), mine.get('tasks', []), theirs.get('tasks', []))
+        merged[option] = checklist
+    return merged
+
+
+class ChecklistModel:
+    """
+    The checklist data and its rules, with no dependency on Tk.
+
+    Data is organized by call type then checklist option, each entry a Checklist.
+    Call types are materialised on first use: until then they stay in `stored` in
+    their serialised form, so startup cost does not grow with the catalogue.
+    Every mutation holds `lock` and is then reported to each callable in `listeners`
+    as listener(kind, call_type, checklist_type, index). Sub-checklist item toggles are
+    reported as kind 'sub', with the item's path of positions as the index.
+
+    Several app instances can share one file. It carries a '_meta' entry with a
+    version counter per call type; sync() and reload_changed() merge the call types
+    other instances changed into this copy instead of overwriting them, and report
+    each one as a 'merge' change (from the writer thread).
+
+    Templates come from the definitions, so an edit to the definitions file reaches
+    every checklist that has not been edited itself. The file keeps a copy of a
+    template's texts, under '_templates' by content hash, only for checklists whose
+    done state refers to it or whose template the definitions do not have; if the
+    template has changed when the file is read back, that state follows the tasks
+    by their text.
+    """
+    def __init__(self, definitions=None, call_types=None):
+        self.definitions = definitions or Definitions.load()
+        self.call_types = list(call_types or self.definitions.call_types)
+        self.checklist_options = list(self.definitions.modes)
+        self.templates = dict(self.definitions.templates)
+        # Template texts saved in the data, by the 'version' key checklists refer to them with.
+        self.saved_templates = {}
+        # Materialised call types, and serialised ones not used yet.
+        self.checklists = {}
+        self.stored = {}
+        self.lock = threading.RLock()
+        self.listeners = []
+        # Shared-file bookkeeping: last file version seen or written, per call type
+        # versions, the serialised call types as last read from/written to disk, call
+        # types changed here since then, and the (mtime, size) of the file when last read.
+        self.version = 0
+        self.versions = {}
+        self.base = {}
+        self.dirty_types = set()
+        self.disk_stamp = None
+        # Checklist options flagged daily_refresh, per call type, so the daily reset
+        # only looks at those instead of every checklist.
+        self.daily = {}
+
+    def notify(self, kind, call_type, checklist_type, index=None):
+        if kind in PERSISTED_CHANGES:
+            self.dirty_types.add(call_type)
+        for listener in self.listeners:
+            listener(kind, call_type, checklist_type, index)
+
+    def load(self, path, data=None, events=(), refresh=True):
+        # `data` is the file's parsed content when the caller already has it (see read_files);
+        # `events` are changes made since the file was written, replayed onto it (see Journal) and
+        # merged with other instances' edits when they carry their base (see change_events).
+        # Without `refresh`, stale daily checklists are left as they are.
+        if data is None:
+            data = {}
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    data = parse_data(f.read(), path)
+        data = dict(data)
+        meta = data.pop('_meta', {})
+        with self.lock:
+            self.version = meta.get('version', 0)
+            self.versions = dict(meta.get('types', {}))
+            self.disk_stamp = file_stamp(path)
+            self.set_data(data, events=events, refresh=refresh)
+
+    def set_checklist(self, call_type, checklist_type, data):
+        # Replace one checklist with its serialised form received from elsewhere.
+        with self.lock:
+            options = self.call_type(call_type)
+            options[checklist_type] = Checklist.from_json(data, self.templates,
+                                                          self.definitions.presets.get((call_type, checklist_type)),
+                                                          self.saved_templates)
+            self.track_daily(call_type, self.serialize_call_type(call_type))
+        self.notify('server', call_type, checklist_type)
+
+    def replace_call_type(self, call_type, options):
+        # Replace every checklist of a call type with serialised ones received from elsewhere.
+        with self.lock:
+            # Tracked first, so options it cannot read are rejected before anything changes.
+            self.track_daily(call_type, options)
+            if call_type in self.checklists:
+                self.checklists[call_type] = self.build_call_type(call_type, options)
+            else:
+                self.stored[call_type] = options
+        self.notify('server', call_type, None)
+
+    def replace_template(self, name, texts):
+        # Change a shared template; checklists using it without their own edits follow it.
+        changed = []
+        with self.lock:
+            self.add_templates({name: texts}, replace=True)
+            for ct, options in self.checklists.items():
+                for option, checklist in options.items():
+                    if checklist.template == name and checklist.overlay is None:
+                        checklist.shared = self.templates[name]
+                        checklist.done &= (1 << len(checklist.shared)) - 1
+                        checklist.subs = {path: bits for path, bits in checklist.subs.items()
+                                          if path[0] < len(checklist.shared)}
+                        changed.append((ct, option))
+        for ct, option in changed:
+            self.notify('template', ct, option)
+        return changed
+
+    def set_data(self, data, today=None, events=(), refresh=True):
+        # Replace all checklists with serialised data; call types are built when first used.
+        # `events` are applied before the daily reset, which may postdate them.
+        with self.lock:
+            self.read_saved_templates(data)
+            self.base = {ct: options for ct, options in data.items() if not ct.startswith('_')}
+            self.stored = dict(self.base)
+            self.checklists = {}
+            self.dirty_types = set()
+            self.daily = {}
+            for ct, options in self.stored.items():
+                self.track_daily(ct, options)
+        for event in events:
+            try:
+                self.apply_event(event)
+            except (KeyError, IndexError, TypeError, ValueError):
+                pass  # A task or checklist since removed from the data.
+        if refresh:
+            self.refresh_daily(today)
+
+    def track_daily(self, call_type, options):
+        # Record which of a call type's serialised checklists are flagged daily_refresh.
+        flagged = [option for option, entry in options.items() if entry.get('daily_refresh', False)]
+        if flagged:
+            self.daily[call_type] = flagged
+        else:
+            self.daily.pop(call_type, None)
+
+    def call_type(self, call_type):
+        # Checklists of one call type, built from stored data and the definitions on first use.
+        options = self.checklists.get(call_type)
+        if options is not None:
+            return options
+        with self.lock:
+            options = self.build_call_type(call_type, self.stored.pop(call_type, {}))
+            if call_type in self.call_types:
+                # Ensure every defined call type has every checklist option, filling empty lists from the presets.
+                for option in self.checklist_options:
+                    preset = self.definitions.presets.get((call_type, option))
+                    checklist = options.get(option)
+                    if checklist is None:
+                        options[option] = Checklist(preset, self.templates.get(preset, ()),
+                                                    last_refresh=date.today().isoformat())
+                    elif not checklist.texts and preset:
+                        checklist.use_template(preset, self.templates)
+            self.checklists[call_type] = options
+            # Defaults filled in or old-format data still need writing.
+            if self.serialize_call_type(call_type) != self.base.get(call_type):
+                self.dirty_types.add(call_type)
+        return options
+
+    def read_saved_templates(self, data):
+        # Take the template copies out of serialised data (see the class docstring). Files
+        # written before they were keyed by content hash kept every template by name, and
+        # their checklists refer to theirs by name.
+        saved = data.get('_templates') or {}
+        for name, texts in saved.items():
+            self.saved_templates[name] = tuple(sys.intern(text) for text in texts)
+        if saved:
+            for ct, options in data.items():
+                if ct.startswith('_'):
+                    continue
+                for entry in options.values():
+                    if 'done' in entry and 'version' not in entry and 'tasks' not in entry \
+                            and entry.get('template') in saved:
+                        entry['version'] = entry['template']
+
+    def add_templates(self, templates, replace=False):
+        # Templates stored in a file win over the built-in ones of the same name, since
+        # that file's checklists were built from them.
+        for name, texts in templates.items():
+            if replace or name not in self.templates:
+                self.templates[name] = tuple(sys.intern(text) for text in texts)
+
+    def reload_changed(self, path):
+        # Merge in the call types other instances have written since we last looked.
+        # Call while holding the shared file lock; returns the call types that changed here.
+        stamp = file_stamp(path)
+        if stamp is None or stamp == self.disk_stamp:
+            return []
+        with open(path, 'r') as f:
+            try:
+                remote = json.load(f)
+            except ValueError:
+                return []
+        self.disk_stamp = stamp
+        meta = remote.pop('_meta', {})
+        changed = []
+        with self.lock:
+            self.read_saved_templates(remote)
+            for ct, version in meta.get('types', {}).items():
+                if ct not in remote or version == self.versions.get(ct):
+                    continue
+                if ct in self.dirty_types:
+                    merged = merge_call_type(self.expand(ct, self.base.get(ct, {})),
+                                             self.expand(ct, self.serialize_call_type(ct)),
+                                             self.expand(ct, remote[ct]))
+                else:
+                    merged = remote[ct]
+                if ct in self.checklists:
+                    self.checklists[ct] = self.build_call_type(ct, merged)
+                else:
+                    self.stored[ct] = merged
+                self.track_daily(ct, merged)
+                self.base[ct] = remote[ct]
+                self.versions[ct] = version
+                changed.append(ct)
+            self.version = max(self.version, meta.get('version', 0))
+        for ct in changed:
+            self.notify('merge', ct, None)
+        return changed
+
+    def sync(self, path):
+        # Snapshot for a shared file, called by the writer thread while holding the file lock:
+        # fold in other instances' edits, then stamp our changed call types with a new version.
+        self.reload_changed(path)
+        with self.lock:
+            self.version += 1
+            for ct in self.dirty_types:
+                self.versions[ct] = self.version
+                self.base[ct] = self.serialize_call_type(ct)
+            self.dirty_types.clear()
+            return self.dumps({'version': self.version, 'types': self.versions})
+
+    def change_events(self, kind, call_type, checklist_type, index, with_base=False):
+        """
+        A change as events that can be applied more than once with the same result:
+        a toggle as the task's text and new done state, anything else as the whole
+        serialised checklist (every checklist of the call type when `checklist_type` is None).
+        With `with_base`, a whole checklist also carries the one it was made from (as last
+        read from or written to the file, None if it was in neither), so that applying it
+        later merges it with the edits made elsewhere since (see apply_event).
+        """
+        with self.lock:
+            if kind == 'toggle':
+                checklist = self.checklist(call_type, checklist_type)
+                return [{'kind': 'toggle', 'call_type': call_type, 'checklist_type': checklist_type,
+                         'index': index, 'text': checklist.texts[index], 'done': checklist.is_done(index)}]
+            options = [checklist_type] if checklist_type is not None else list(self.call_type(call_type))
+            events = [{'kind': 'put', 'call_type': call_type, 'checklist_type': option,
+                       'checklist': self.checklist(call_type, option).to_json()} for option in options]
+            if with_base:
+                base = self.base.get(call_type, {})
+                for event in events:
+                    event['base'] = base.get(event['checklist_type'])
+            return events
+
+    def apply_event(self, event):
+        # Apply one event from change_events(); returns the position of a toggled task.
+        kind, call_type, checklist_type = event['kind'], event['call_type'], event['checklist_type']
+        if kind == 'toggle':
+            with self.lock:
+                checklist = self.checklist(call_type, checklist_type)
+                index = event['index']
+                text = event.get('text')
+                # Tasks may have moved since; find the task by its text.
+                if text is not None and (index >= len(checklist.texts) or checklist.texts[index] != text):
+                    index = checklist.texts.index(text)
+                if checklist.is_done(index) != bool(event['done']):
+                    self.toggle(call_type, checklist_type, index)
+            return index
+        if kind == 'put':
+            entry = event['checklist']
+            if 'base' in event:
+                with self.lock:
+                    current = self.call_type(call_type).get(checklist_type)
+                    if current is not None:
+                        # Three-way merge, as with another instance's edits: the checklist
+                        # may have changed since `entry` was made from `base`.
+                        base = event['base']
+                        if base is None:
+                            # Not in the file then: made from the preset, as call_type() fills it in.
+                            preset = self.definitions.presets.get((call_type, checklist_type))
+                            base = {'template': preset, 'done': '0'} if preset else {'tasks': []}
+                        now = self.serialize_checklist(current)
+                        entry = merge_call_type(self.expand(call_type, {checklist_type: base}),
+                                                self.expand(call_type, {checklist_type: entry}),
+                                                self.expand(call_type, {checklist_type: now}))[checklist_type]
+            self.set_checklist(call_type, checklist_type, entry)
+            return None
+        raise ValueError(f"unknown event kind {kind!r}")
+
+    def build_call_type(self, call_type, options):
+        # Checklists for one call type from their serialised (or expanded) form.
+        return {option: Checklist.from_json(entry, self.templates, self.definitions.presets.get((call_type, option)),
+                                            self.saved_templates)
+                for option, entry in options.items()}
+
+    def serialize_call_type(self, call_type):
+        if call_type not in self.checklists:
+            return self.stored[call_type]
+        return {option: self.serialize_checklist(checklist) for option, checklist in self.checklists[call_type].items()}
+
+    def serialize_checklist(self, checklist):
+        # Checklist.to_json(), naming the template version its state refers to when it has
+        # to be kept: done state on a shared template, or a template not in the definitions.
+        data = checklist.to_json()
+        if checklist.overlay is None and checklist.template and (
+                checklist.done or checklist.subs
+                or checklist.shared != self.definitions.templates.get(checklist.template)):
+            version = template_version(checklist.shared)
+            self.saved_templates.setdefault(version, checklist.shared)
+            data['version'] = version
+        return data
+
+    def expand(self, call_type, options):
+        # Serialised checklists of one call type in the expanded form merge_call_type works on.
+        expanded = {}
+        for option, checklist in self.build_call_type(call_type, options).items():
+            expanded[option] = {
+                'daily_refresh': checklist.daily_refresh,
+                'last_refresh': checklist.last_refresh,
+                'template': checklist.template,
+                'tasks': checklist.to_tasks()
+            }
+        return expanded
+
+    def refresh_daily(self, today=None):
+        # Reset the done status of flagged checklists whose last refresh wasn't today.
+        # Only flagged checklists are looked at; stale ones still serialised are built first.
+        today = today or date.today().isoformat()
+        refreshed = []
+        with self.lock:
+            for ct, options in list(self.daily.items()):
+                for option in options:
+                    if ct in self.checklists:
+                        last_refresh = self.checklists[ct][option].last_refresh
+                    else:
+                        last_refresh = self.stored[ct][option].get('last_refresh', '')
+                    if last_refresh != today:
+                        checklist = self.checklist(ct, option)
+                        checklist.clear()
+                        checklist.last_refresh = today
+                        refreshed.append((ct, option))
+        for ct, option in refreshed:
+            self.notify('refresh', ct, option)
+        return refreshed
+
+    def set_daily_refresh(self, call_type, checklist_type, enabled):
+        # Turn the daily reset of one checklist on or off.
+        with self.lock:
+            checklist = self.checklist(call_type, checklist_type)
+            checklist.daily_refresh = enabled
+            self.track_daily(call_type, self.serialize_call_type(call_type))
+        self.notify('refresh', call_type, checklist_type)
+
+    def dumps(self, meta=None):
+        with self.lock:
+            data = {ct: self.serialize_call_type(ct) for ct in list(self.checklists) + list(self.stored)}
+            versions = {entry['version'] for options in data.values() for entry in options.values() if 'version' in entry}
+            data['_templates'] = {version: list(self.saved_templates[version])
+                                  for version in sorted(versions) if version in self.saved_templates}
+            if meta is not None:
+                data['_meta'] = meta
+            return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+    def checklist(self, call_type, checklist_type):
+        return self.call_type(call_type)[checklist_type]
+
+    def toggle(self, call_type, checklist_type, index):
+        with self.lock:
+            done = self.checklist(call_type, checklist_type).toggle(index)
+        self.notify('toggle', call_type, checklist_type, index)
+        return done
+
+    def add(self, call_type, checklist_type, text):
+        with self.lock:
+            index = self.checklist(call_type, checklist_type).add(text)
+        self.notify('add', call_type, checklist_type, index)
+        return index
+
+    def edit(self, call_type, checklist_type, index, text):
+        with self.lock:
+            self.checklist(call_type, checklist_type).edit(index, text)
+        self.notify('edit', call_type, checklist_type, index)
+
+    def delete(self, call_type, checklist_type, index):
+        with self.lock:
+            self.checklist(call_type, checklist_type).delete(index)
+        self.notify('delete', call_type, checklist_type, index)
+
+    def import_tasks(self, rows, replace=False):
+        # Apply (call_type, checklist_type, text, done) rows as one batch, appending to
+        # each checklist (or replacing its tasks); one 'import' change per checklist.
+        grouped = {}
+        for call_type, checklist_type, text, done in rows:
+            grouped.setdefault((call_type, checklist_type), []).append((text, done))
+        with self.lock:
+            for (call_type, checklist_type), tasks in grouped.items():
+                checklist = self.checklist(call_type, checklist_type)
+                if replace:
+                    checklist.overlay = []
+                    checklist.clear()
+                texts = checklist.own_texts()
+                checklist.done |= bits_to_int([done for _, done in tasks]) << len(texts)
+                texts.extend(sys.intern(text) for text, _ in tasks)
+        for call_type, checklist_type in grouped:
+            self.notify('import', call_type, checklist_type)
+        return list(grouped)
+
+    def reset(self, call_type, checklist_type):
+        # New call: untick every task and sub-checklist item.
+        with self.lock:
+            self.checklist(call_type, checklist_type).clear()
+        self.notify('reset', call_type, checklist_type)
+
+    def sub_checklist(self, call_type, checklist_type, path):
+        # Name of the sub-checklist owned by the task (or sub-item) at `path`, or None (also when
+        # the path no longer exists). Only dictionary lookups, so it is cheap to ask for every row.
+        tasks = self.definitions.task_subchecklists.get((call_type, checklist_type))
+        if tasks is None:
+            return None
+        texts = self.checklist(call_type, checklist_type).texts
+        if path[0] >= len(texts):
+            return None
+        name = tasks.get(texts[path[0]])
+        for position in path[1:]:
+            if name is None or position >= len(self.definitions.subchecklists[name]):
+                return None
+            name = self.definitions.subchecklists[name][position][1]
+        return name
+
+    def sub_done(self, checklist, path, name):
+        # True when every item of sub-checklist `name` at `path` is done, nested ones included.
+        bits = checklist.subs.get(path, 0)
+        for position, (text, child) in enumerate(self.definitions.subchecklists[name]):
+            if child is not None:
+                if not self.sub_done(checklist, path + (position,), child):
+                    return False
+            elif not (bits >> position) & 1:
+                return False
+        return True
+
+    def is_task_done(self, call_type, checklist_type, index):
+        # A task with a sub-checklist is done once all of its items are.
+        checklist = self.checklist(call_type, checklist_type)
+        name = self.sub_checklist(call_type, checklist_type, (index,))
+        if name is None:
+            return checklist.is_done(index)
+        return self.sub_done(checklist, (index,), name)
+
+    def sub_rows(self, call_type, checklist_type, path, expanded):
+        """
+        Rows to display under the task (or sub-item) at `path`: (path, depth, text, done,
+        has sub-checklist) for its items, descending only into paths in `expanded`.
+        """
+        checklist = self.checklist(call_type, checklist_type)
+        rows = []
+
+        def visit(owner, name, depth):
+            bits = checklist.subs.get(owner, 0)
+            for position, (text, child) in enumerate(self.definitions.subchecklists[name]):
+                item = owner + (position,)
+                if child is None:
+                    rows.append((item, depth, text, (bits >> position) & 1 == 1, False))
+                else:
+                    rows.append((item, depth, text, self.sub_done(checklist, item, child), True))
+                    if item in expanded:
+                        visit(item, child, depth + 1)
+
+        visit(path, self.sub_checklist(call_type, checklist_type, path), 0)
+        return rows
+
+    def sub_item(self, call_type, checklist_type, path):
+        # (text, done) of the sub-checklist item at `path`.
+        name = self.sub_checklist(call_type, checklist_type, path[:-1])
+        bits = self.checklist(call_type, checklist_type).subs.get(path[:-1], 0)
+        return self.definitions.subchecklists[name][path[-1]][0], (bits >> path[-1]) & 1 == 1
+
+    def toggle_sub(self, call_type, checklist_type, path):
+        # Tick or untick the sub-checklist item at `path`; reported as a 'sub' change
+        # whose index is the path.
+        with self.lock:
+            checklist = self.checklist(call_type, checklist_type)
+            owner = path[:-1]
+            bits = checklist.subs.get(owner, 0) ^ (1 << path[-1])
+            if bits:
+                checklist.subs[owner] = bits
+            else:
+                checklist.subs.pop(owner, None)
+        self.notify('sub', call_type, checklist_type, path)
+        return (bits >> path[-1]) & 1 == 1
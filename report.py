@@ -0,0 +1,271 @@
+"""
+End-of-day report over the checklist files and call histories collected from every desk.
+
+Each file in the directory (searched recursively) is read by a pool of worker
+processes: checklists files (*.json, as the app writes them) give the state each
+desk ended the day in, history databases (*.sqlite3) every call recorded. Their
+tallies are added up per call type, mode and task, and written as CSV and JSON:
+
+    tasks.csv      completion of every task, over desks and over calls
+    modes.csv      completion per call type and mode
+    skipped.csv    the most-skipped tasks
+    substeps.csv   how often each sub-checklist item (the objection steps) was ticked
+    report.json    all of the above
+
+Each file's tallies are kept in a cache in the output directory, so a re-run only
+reads the files that changed since.
+
+    python report.py collected/ --out report/
+    python report.py collected/ --out report/ --days 1 --workers 8
+"""
+import argparse
+import csv
+import io
+import json
+import marshal
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from history import DAY
+from model import DEFINITIONS_FILE, ChecklistModel, Definitions
+from storage import atomic_write, file_stamp
+
+CHECKLIST_SUFFIXES = ('.json',)
+HISTORY_SUFFIXES = ('.sqlite3', '.db')
+CACHE_FILE = "report.cache"
+# Bump when the tallies change shape, so older caches are ignored.
+CACHE_VERSION = 1
+SKIPPED_ROWS = 20
+
+# Definitions shared by every file a worker process reads; set by init_worker().
+_definitions = None
+
+
+def init_worker(definitions_path):
+    global _definitions
+    _definitions = Definitions.load(definitions_path)
+
+
+def find_files(directory, exclude=None):
+    # Checklists files and history databases under `directory` (but not under `exclude`), in a stable order.
+    exclude = exclude and os.path.abspath(exclude)
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if os.path.abspath(os.path.join(root, d)) != exclude)
+        for name in sorted(files):
+            if name.endswith(CHECKLIST_SUFFIXES + HISTORY_SUFFIXES):
+                found.append(os.path.join(root, name))
+    return found
+
+
+def tally_checklists(path):
+    """
+    Tallies of one checklists file: per (call type, mode, task) [desks, desks done,
+    calls, calls done], and per (call type, mode, task, sub-item) [desks ticked, ticks].
+    """
+    # Parsed here so a damaged file is reported as an error rather than read as empty.
+    with open(path, 'rb') as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError("not a checklists file")
+    model = ChecklistModel(_definitions)
+    # As the desk left it: a daily reset now would clear the day being reported on.
+    model.load(path, data, refresh=False)
+    tasks, subs = {}, {}
+    for call_type in list(model.checklists) + list(model.stored):
+        for mode, checklist in model.call_type(call_type).items():
+            for position, text in enumerate(checklist.texts):
+                counts = tasks.setdefault((call_type, mode, text), [0, 0, 0, 0])
+                counts[0] += 1
+                counts[1] += model.is_task_done(call_type, mode, position)
+            for owner, bits in checklist.subs.items():
+                if owner[0] >= len(checklist.texts) or model.sub_checklist(call_type, mode, owner) is None:
+                    continue
+                task = checklist.texts[owner[0]]
+                for position in range(bits.bit_length()):
+                    if (bits >> position) & 1:
+                        item, _ = model.sub_item(call_type, mode, owner + (position,))
+                        subs.setdefault((call_type, mode, task, item), [0, 0])[0] += 1
+    return tasks, subs
+
+
+def tally_history(path, since):
+    # Tallies of one history database, in the same shape as tally_checklists(), from calls started after `since`.
+    tasks, subs = {}, {}
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            "SELECT call_type, mode, task, COUNT(*), SUM(done) FROM call_tasks "
+            "WHERE started_at >= ? GROUP BY call_type, mode, task", (since,))
+        for call_type, mode, task, calls, done in rows:
+            tasks[(call_type, mode, task)] = [0, 0, calls, done]
+        rows = conn.execute(
+            "SELECT c.call_type, c.mode, t.task, t.sub_item, COUNT(*) FROM toggles t JOIN calls c ON c.id = t.call_id "
+            "WHERE t.sub_item IS NOT NULL AND t.done = 1 AND c.started_at >= ? "
+            "GROUP BY c.call_type, c.mode, t.task, t.sub_item", (since,))
+        for call_type, mode, task, item, ticks in rows:
+            subs[(call_type, mode, task, item)] = [0, ticks]
+    finally:
+        conn.close()
+    return tasks, subs
+
+
+def tally_file(job):
+    # Worker entry point: (path, since) -> (path, (tasks, subs) or None, error or None).
+    path, since = job
+    try:
+        if path.endswith(HISTORY_SUFFIXES):
+            return path, tally_history(path, since), None
+        return path, tally_checklists(path), None
+    except (OSError, ValueError, KeyError, IndexError, TypeError, AttributeError, sqlite3.Error) as e:
+        return path, None, f"{type(e).__name__}: {e}"
+
+
+def add_tallies(totals, tallies, sign=1):
+    # Add one file's (tasks, subs) tallies to `totals`, or take them away with sign=-1.
+    for total, tally in zip(totals, tallies):
+        for key, counts in tally.items():
+            current = total.get(key)
+            if current is None:
+                current = total[key] = [0] * len(counts)
+            for i, n in enumerate(counts):
+                current[i] += sign * n
+            if not any(current):
+                del total[key]
+
+
+def read_cache(path, since):
+    """
+    The cache of an earlier run over the same period: {'files': {path: (stamp, tallies)},
+    'totals': (tasks, subs)}, or None. Stored with marshal, so only the same Python reads it.
+    """
+    try:
+        with open(path, 'rb') as f:
+            cache = marshal.loads(f.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(cache, dict) or cache.get('key') != (CACHE_VERSION, sys.hexversion, since):
+        return None
+    return cache
+
+
+def collect(files, since, cache, workers=None, definitions_path=DEFINITIONS_FILE):
+    """
+    Tallies of every file and their totals, as a new cache: unchanged files are taken
+    from `cache` and the others read by the worker pool, and only the changed files'
+    tallies are taken from and added to the cached totals. Returns (cache, number of
+    files read, [(path, error)]).
+    """
+    cached_files = cache['files'] if cache else {}
+    totals = cache['totals'] if cache else ({}, {})
+    entries, jobs, stamps = {}, [], {}
+    for path in files:
+        stamp = file_stamp(path)
+        if stamp is None:
+            continue  # Removed since the directory was listed.
+        cached = cached_files.get(path)
+        if cached is not None and cached[0] == stamp:
+            entries[path] = cached
+        else:
+            stamps[path] = stamp
+            jobs.append((path, since))
+    for path, (stamp, tallies) in cached_files.items():
+        if path not in entries:
+            add_tallies(totals, tallies, -1)
+    errors = []
+    if jobs:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(definitions_path,)) as pool:
+            chunksize = max(1, len(jobs) // (4 * workers))
+            for path, tallies, error in pool.map(tally_file, jobs, chunksize=chunksize):
+                if error is not None:
+                    errors.append((path, error))
+                else:
+                    entries[path] = (stamps[path], tallies)
+                    add_tallies(totals, tallies)
+    return {'key': (CACHE_VERSION, sys.hexversion, since), 'files': entries, 'totals': totals}, len(jobs), errors
+
+
+def rate(done, total):
+    return round(done / total, 4) if total else None
+
+
+def summarise(tasks, subs, skipped_rows=SKIPPED_ROWS):
+    # The report's tables as lists of dicts: tasks, modes, skipped and substeps.
+    task_rows, modes = [], {}
+    for (call_type, mode, task), (desks, desks_done, calls, calls_done) in sorted(tasks.items()):
+        task_rows.append({'call_type': call_type, 'mode': mode, 'task': task,
+                          'desks': desks, 'desks_done': desks_done, 'desk_rate': rate(desks_done, desks),
+                          'calls': calls, 'calls_done': calls_done, 'call_rate': rate(calls_done, calls)})
+        totals = modes.setdefault((call_type, mode), [0, 0, 0, 0])
+        for i, n in enumerate((desks, desks_done, calls, calls_done)):
+            totals[i] += n
+    mode_rows = [{'call_type': call_type, 'mode': mode,
+                  'desk_rate': rate(desks_done, desks), 'call_rate': rate(calls_done, calls)}
+                 for (call_type, mode), (desks, desks_done, calls, calls_done) in sorted(modes.items())]
+    # Calls say more than end-of-day state, so tasks are ranked by calls skipped first.
+    skipped = sorted(task_rows, key=lambda row: (-(row['calls'] - row['calls_done']),
+                                                 -(row['desks'] - row['desks_done']),
+                                                 row['call_type'], row['mode'], row['task']))
+    skipped_rows = [dict(row, calls_skipped=row['calls'] - row['calls_done'],
+                         desks_skipped=row['desks'] - row['desks_done'])
+                    for row in skipped[:skipped_rows] if row['calls'] > row['calls_done'] or row['desks'] > row['desks_done']]
+    sub_rows = [{'call_type': call_type, 'mode': mode, 'task': task, 'sub_item': item,
+                 'desks_ticked': desks, 'ticks': ticks}
+                for (call_type, mode, task, item), (desks, ticks) in sorted(subs.items())]
+    return {'tasks': task_rows, 'modes': mode_rows, 'skipped': skipped_rows, 'substeps': sub_rows}
+
+
+def to_csv(rows):
+    out = io.StringIO()
+    if rows:
+        writer = csv.DictWriter(out, list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return out.getvalue().encode('utf-8')
+
+
+def write_report(out_dir, summary):
+    os.makedirs(out_dir, exist_ok=True)
+    for name, rows in summary.items():
+        atomic_write(os.path.join(out_dir, f"{name}.csv"), to_csv(rows))
+    atomic_write(os.path.join(out_dir, "report.json"), json.dumps(summary, ensure_ascii=False, indent=1).encode('utf-8'))
+
+
+def run(directory, out_dir, days=None, workers=None, definitions_path=DEFINITIONS_FILE, now=None):
+    # Build (or refresh) the report; returns (files, files read, [(path, error)]).
+    # Calls in history databases count from midnight `days` days ago (all of them when None).
+    since = 0
+    if days is not None:
+        midnight = time.mktime(time.localtime(now or time.time())[:3] + (0, 0, 0, 0, 0, -1))
+        since = midnight - (days - 1) * DAY
+    cache_path = os.path.join(out_dir, CACHE_FILE)
+    files = find_files(directory, exclude=out_dir)
+    cache, read, errors = collect(files, since, read_cache(cache_path, since), workers, definitions_path)
+    write_report(out_dir, summarise(*cache['totals']))
+    atomic_write(cache_path, marshal.dumps(cache))
+    return len(files), read, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report checklist completion across many desks.")
+    parser.add_argument("directory", help="collected checklists files and history databases")
+    parser.add_argument("--out", default="report", help="output directory (also holds the cache)")
+    parser.add_argument("--days", type=int, help="only calls from the last N days, today included")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--definitions", default=DEFINITIONS_FILE, help="call type definitions file")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    files, read, errors = run(args.directory, args.out, args.days, args.workers, args.definitions)
+    for path, error in errors:
+        print(f"{path}: {error}")
+    print(f"{files} files ({read} read, {files - read} unchanged) in {time.perf_counter() - start:.1f}s; "
+          f"report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+In-memory task search across every call type and checklist mode.
+
+TaskIndex keeps an inverted index from words to the checklists' task texts, plus a
+sorted vocabulary so the word being typed can be matched as a prefix. It follows
+the model's change notifications and re-indexes only the checklist that changed.
+"""
+import heapq
+import re
+import threading
+from bisect import bisect_left, insort
+
+WORD = re.compile(r"\w+")
+FUZZY_ALPHABET = "abcdefghijklmnopqrstuvwxyz0123456789"
+
+# Changes that can alter a checklist's task texts.
+TEXT_CHANGES = ('add', 'edit', 'delete', 'import', 'merge', 'server', 'template')
+
+
+def tokenize(text):
+    return WORD.findall(text.lower())
+
+
+def edits1(word):
+    # Every string one delete, transpose, replace or insert away from `word`.
+    splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+    deletes = [a + b[1:] for a, b in splits if b]
+    transposes = [a + b[1] + b[0] + b[2:] for a, b in splits if len(b) > 1]
+    replaces = [a + c + b[1:] for a, b in splits if b for c in FUZZY_ALPHABET]
+    inserts = [a + c + b for a, b in splits for c in FUZZY_ALPHABET]
+    return set(deletes + transposes + replaces + inserts)
+
+
+class TaskIndex:
+    """
+    Ranked prefix/fuzzy search over task texts.
+
+    A document is one distinct task text in one (call_type, checklist_type); repeats
+    of the same text in a checklist share a document.
+    Results rank documents matching more words exactly first, then shorter texts.
+    """
+    def __init__(self, model=None):
+        self.lock = threading.Lock()
+        self.docs = {}        # doc id -> (call_type, checklist_type, text, tokens)
+        self.doc_ids = {}     # (call_type, checklist_type, text) -> doc id
+        self.postings = {}    # word -> [(len(text), doc id)], shortest texts first once sorted by posting()
+        self.vocabulary = []  # sorted words, for prefix ranges
+        self.checklists = {}  # (call_type, checklist_type) -> set of indexed texts
+        self.unsorted = set()  # words whose postings were appended to since last sorted
+        self.next_id = 0
+        self.model = model
+        if model is not None:
+            model.listeners.append(self.on_change)
+
+    def build(self):
+        # Index every checklist of the model (this builds call types not used yet).
+        for ct in self.model.call_types:
+            for option, checklist in self.model.call_type(ct).items():
+                self.update_checklist(ct, option, checklist.texts)
+
+    def on_change(self, kind, call_type, checklist_type, index):
+        if kind not in TEXT_CHANGES:
+            return
+        if checklist_type is None:
+            # A merge or server update replaces every checklist of the call type.
+            for option, checklist in self.model.call_type(call_type).items():
+                self.update_checklist(call_type, option, checklist.texts)
+        else:
+            self.update_checklist(call_type, checklist_type, self.model.checklist(call_type, checklist_type).texts)
+
+    def update_checklist(self, call_type, checklist_type, texts):
+        # Diff the checklist's texts against what is indexed and apply only the difference.
+        new = set(texts)
+        with self.lock:
+            old = self.checklists.get((call_type, checklist_type), set())
+            for text in old - new:
+                self._remove(call_type, checklist_type, text)
+            for text in new - old:
+                self._add(call_type, checklist_type, text)
+            self.checklists[(call_type, checklist_type)] = new
+
+    def _add(self, call_type, checklist_type, text):
+        doc_id = self.next_id
+        self.next_id += 1
+        tokens = tuple(tokenize(text))
+        self.docs[doc_id] = (call_type, checklist_type, text, tokens)
+        self.doc_ids[(call_type, checklist_type, text)] = doc_id
+        for token in set(tokens):
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = []
+                insort(self.vocabulary, token)
+            posting.append((len(text), doc_id))
+            self.unsorted.add(token)
+
+    def _remove(self, call_type, checklist_type, text):
+        doc_id = self.doc_ids.pop((call_type, checklist_type, text))
+        tokens = self.docs.pop(doc_id)[3]
+        entry = (len(text), doc_id)
+        for token in set(tokens):
+            posting = self.posting(token)
+            del posting[bisect_left(posting, entry)]
+            if not posting:
+                del self.postings[token]
+                self.unsorted.discard(token)
+                del self.vocabulary[bisect_left(self.vocabulary, token)]
+
+    def posting(self, word):
+        # The postings of `word`, sorted on first use after changes: building the index only appends.
+        posting = self.postings[word]
+        if word in self.unsorted:
+            posting.sort()
+            self.unsorted.discard(word)
+        return posting
+
+    def prefix_range(self, prefix):
+        # Slice bounds of the vocabulary words starting with `prefix`.
+        start = bisect_left(self.vocabulary, prefix)
+        end = bisect_left(self.vocabulary, prefix + "\uffff", start)
+        return start, end
+
+    def search(self, query, limit=20):
+        """
+        Returns up to `limit` (call_type, checklist_type, text) matches for `query`.
+
+        Every query word must match a word of the task as a prefix. When nothing
+        matches, words of three or more letters are retried with one-letter typos.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self.lock:
+            results = self._search(terms, limit)
+            if not results:
+                results = self._search_fuzzy(terms, limit)
+        return results
+
+    def _search(self, terms, limit):
+        ranges = [self.prefix_range(term) for term in terms]
+        if limit <= 0 or any(start == end for start, end in ranges):
+            return []
+        # Drive the search from the term with the fewest matching words and check
+        # the others against each candidate's words. Candidates come shortest first
+        # (see postings), so the scan stops once no candidate left could rank in the
+        # top `limit`: they can only be longer, and match at most `bound` words exactly.
+        driver = min(range(len(terms)), key=lambda i: ranges[i][1] - ranges[i][0])
+        start, end = ranges[driver]
+        term = terms[driver]
+        words = self.vocabulary[start:end]
+        bound = sum(t in self.postings for t in terms)
+        streams = []
+        if term in self.postings:
+            # Tasks with the exact word first; longer words with the prefix cannot match it exactly.
+            words.remove(term)
+            streams.append((self.posting(term), bound))
+            bound -= 1
+        streams.append((heapq.merge(*(self.posting(word) for word in words)), bound))
+        seen = set()
+        best = []  # sorted (-exact, length, text, call_type, checklist_type)
+        for candidates, bound in streams:
+            for length, doc_id in candidates:
+                if len(best) == limit and best[-1][:2] < (-bound, length):
+                    break
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
+                call_type, checklist_type, text, tokens = self.docs[doc_id]
+                exact = 0
+                for t in terms:
+                    if t in tokens:
+                        exact += 1
+                    elif not any(token.startswith(t) for token in tokens):
+                        break
+                else:
+                    key = (-exact, length, text, call_type, checklist_type)
+                    if len(best) < limit or key < best[-1]:
+                        insort(best, key)
+                        del best[limit:]
+        return [(call_type, checklist_type, text) for _, _, text, call_type, checklist_type in best]
+
+    def _search_fuzzy(self, terms, limit):
+        corrected = []
+        for term in terms:
+            start, end = self.prefix_range(term)
+            if start != end or len(term) < 3:
+                corrected.append(term)
+                continue
+            candidates = [word for word in edits1(term) if word in self.postings]
+            if not candidates:
+                return []
+            # Prefer the correction used by the most tasks.
+            corrected.append(max(candidates, key=lambda word: len(self.postings[word])))
+        return self._search(corrected, limit)
@@ -0,0 +1,455 @@
+"""
+Optional checklist server: one process holding every agent's checklists, so
+supervisors can push template changes and follow calls as they happen.
+
+    python server.py --port 8765 --db server.sqlite3
+    python app.py --server http://supervisor-pc:8765 --agent alice
+
+It speaks JSON over HTTP/1.1 with keep-alive, on asyncio:
+
+    GET  /templates                      every template
+    PUT  /templates/<name>               {"tasks": [...]}, pushed to every agent
+    GET  /agents                         each agent's current checklist progress
+    GET  /agents/<agent>/state?since=N   call types changed after version N
+    PUT  /agents/<agent>/state           seed an unknown agent from its local file
+    POST /agents/<agent>/events          {"events": [...]} toggles and checklist updates
+    GET  /events?since=N&wait=S          call events after N, waiting up to S seconds
+
+Changes are kept in memory and written to SQLite in batches (one transaction per
+flush) through a small pool of connections, off the event loop.
+"""
+import argparse
+import asyncio
+import json
+import queue
+import signal
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from model import ChecklistModel, Definitions
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS agents (
+    agent TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS templates (
+    name TEXT PRIMARY KEY,
+    tasks TEXT NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY,
+    agent TEXT NOT NULL,
+    at REAL NOT NULL,
+    kind TEXT NOT NULL,
+    call_type TEXT NOT NULL,
+    checklist_type TEXT NOT NULL,
+    position INTEGER,
+    text TEXT,
+    done INTEGER
+);
+"""
+
+REASONS = {200: b"OK", 400: b"Bad Request", 404: b"Not Found", 405: b"Method Not Allowed"}
+
+# Call events kept in memory for GET /events; older ones are only in the database.
+RECENT_EVENTS = 10000
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ServerStore:
+    """
+    SQLite storage for the server, used from a thread pool so the event loop never
+    blocks on disk. Each worker takes a connection from a fixed pool.
+    """
+    def __init__(self, path, pool_size=4):
+        self.executor = ThreadPoolExecutor(pool_size, thread_name_prefix="server-store")
+        self.pool = queue.Queue()
+        for _ in range(pool_size):
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.pool.put(conn)
+        self._call(lambda conn: conn.executescript(SCHEMA))
+
+    def _call(self, fn):
+        conn = self.pool.get()
+        try:
+            with conn:
+                return fn(conn)
+        finally:
+            self.pool.put(conn)
+
+    async def run(self, fn):
+        # Run fn(conn) in a transaction on a pooled connection.
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._call, fn)
+
+    def close(self):
+        self.executor.shutdown()
+        while not self.pool.empty():
+            self.pool.get().close()
+
+
+class AgentState:
+    """
+    One agent's checklists on the server, with the server version at which each
+    call type last changed (for delta updates) and what the agent is working on.
+    """
+    def __init__(self, model, version=0):
+        self.model = model
+        self.versions = {ct: version for ct in list(model.checklists) + list(model.stored)}
+        self.current = None  # (call_type, checklist_type, at) of the last event
+
+    def progress(self):
+        if self.current is None:
+            return None
+        call_type, checklist_type, at = self.current
+        # Tasks owning a sub-checklist count as done once all of its items are, as in the app.
+        total = len(self.model.checklist(call_type, checklist_type).texts)
+        done = sum(self.model.is_task_done(call_type, checklist_type, i) for i in range(total))
+        return {'call_type': call_type, 'checklist_type': checklist_type, 'at': at, 'done': done, 'total': total}
+
+
+class ChecklistServer:
+    def __init__(self, store, definitions=None, flush_interval=0.2):
+        self.store = store
+        self.definitions = definitions or Definitions.load()
+        self.flush_interval = flush_interval
+        self.templates = dict(self.definitions.templates)
+        self.template_versions = {}
+        self.agents = {}
+        self.loading = {}
+        # One version counter for agents and templates; events have their own sequence.
+        self.version = 0
+        self.seq = 0
+        self.recent = deque(maxlen=RECENT_EVENTS)
+        # Set (and replaced) whenever an event is recorded, waking long-polling clients.
+        self.new_events = asyncio.Event()
+        # Batched writes: agents changed and events recorded since the last flush.
+        self.dirty_agents = set()
+        self.pending_events = []
+        self.dirty_templates = set()
+        # Flushes run one at a time so an older snapshot never lands after a newer one.
+        self.flush_lock = asyncio.Lock()
+        self.error = None
+
+    async def start(self):
+        def read(conn):
+            templates = conn.execute("SELECT name, tasks, version FROM templates").fetchall()
+            version = conn.execute("SELECT MAX(version) FROM agents").fetchone()[0] or 0
+            seq = conn.execute("SELECT MAX(seq) FROM events").fetchone()[0] or 0
+            return templates, version, seq
+
+        templates, version, self.seq = await self.store.run(read)
+        for name, tasks, template_version in templates:
+            self.templates[name] = tuple(json.loads(tasks))
+            self.template_versions[name] = template_version
+        self.version = max([version] + list(self.template_versions.values()))
+        self.flusher = asyncio.create_task(self.flush_periodically())
+
+    async def stop(self):
+        self.flusher.cancel()
+        await self.flush()
+
+    async def agent(self, name, create=True):
+        # The agent's state, read from the database on first use.
+        state = self.agents.get(name)
+        if state is not None:
+            return state
+        if name not in self.loading:
+            self.loading[name] = asyncio.ensure_future(self._load_agent(name))
+        try:
+            state = await self.loading[name]
+        finally:
+            self.loading.pop(name, None)
+        if state is None and create:
+            if name not in self.agents:
+                self.agents[name] = AgentState(self.new_model({}))
+            state = self.agents[name]
+        return state
+
+    async def _load_agent(self, name):
+        row = await self.store.run(lambda conn: conn.execute(
+            "SELECT data, version FROM agents WHERE agent = ?", (name,)).fetchone())
+        if name in self.agents:
+            return self.agents[name]
+        if row is None:
+            return None
+        state = self.agents[name] = AgentState(self.new_model(json.loads(row[0])), row[1])
+        return state
+
+    def new_model(self, data):
+        model = ChecklistModel(self.definitions)
+        model.add_templates(self.templates, replace=True)
+        model.set_data(data)
+        return model
+
+    def bump(self, name, state, call_type):
+        self.version += 1
+        state.versions[call_type] = self.version
+        self.dirty_agents.add(name)
+
+    def record(self, name, kind, call_type, checklist_type, position=None, text=None, done=None):
+        self.seq += 1
+        event = {'seq': self.seq, 'agent': name, 'at': time.time(), 'kind': kind, 'call_type': call_type,
+                 'checklist_type': checklist_type, 'position': position, 'text': text, 'done': done}
+        self.recent.append(event)
+        self.pending_events.append(event)
+        self.new_events.set()
+        self.new_events = asyncio.Event()
+
+    async def flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        async with self.flush_lock:
+            await self._flush()
+
+    async def _flush(self):
+        # Write everything changed since the last flush in one transaction.
+        if not (self.dirty_agents or self.pending_events or self.dirty_templates):
+            return
+        agents = []
+        for name in self.dirty_agents:
+            state = self.agents[name]
+            model = state.model
+            data = {ct: model.serialize_call_type(ct) for ct in list(model.checklists) + list(model.stored)}
+            agents.append((name, json.dumps(data, separators=(',', ':')), max(state.versions.values(), default=0)))
+        events = [(e['seq'], e['agent'], e['at'], e['kind'], e['call_type'], e['checklist_type'],
+                   e['position'], e['text'], e['done']) for e in self.pending_events]
+        templates = [(name, json.dumps(list(self.templates[name])), self.template_versions[name])
+                     for name in self.dirty_templates]
+        batch = (self.dirty_agents, self.pending_events, self.dirty_templates)
+        self.dirty_agents, self.pending_events, self.dirty_templates = set(), [], set()
+
+        def write(conn):
+            conn.executemany("INSERT OR REPLACE INTO agents VALUES (?, ?, ?)", agents)
+            conn.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", events)
+            conn.executemany("INSERT OR REPLACE INTO templates VALUES (?, ?, ?)", templates)
+
+        try:
+            await self.store.run(write)
+        except sqlite3.Error as e:
+            # Keep the batch so the next flush writes it again.
+            self.error = e
+            self.dirty_agents |= batch[0]
+            self.pending_events[:0] = batch[1]
+            self.dirty_templates |= batch[2]
+            return
+        self.error = None
+
+    # Request handling
+
+    async def handle(self, reader, writer):
+        # One client connection; requests are answered in order while it stays open.
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                try:
+                    status, payload = 200, await self.dispatch(method, target, body)
+                except RequestError as e:
+                    status, payload = e.status, {'error': str(e)}
+                data = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+                writer.write(b"HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n"
+                             % (status, REASONS[status], len(data)) + data)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        parts = [unquote(part) for part in url.path.strip('/').split('/')]
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            raise RequestError(400, "invalid JSON body")
+        if method in ('PUT', 'POST') and not isinstance(payload, dict):
+            raise RequestError(400, "body must be a JSON object")
+        try:
+            since = int(query.get('since', 0))
+        except ValueError:
+            raise RequestError(400, "since must be an integer")
+        try:
+            wait = float(query.get('wait', 0))
+        except ValueError:
+            raise RequestError(400, "wait must be a number")
+
+        if parts == ['templates'] and method == 'GET':
+            return {'version': self.version, 'templates': {name: list(texts) for name, texts in self.templates.items()}}
+        if len(parts) == 2 and parts[0] == 'templates' and method == 'PUT':
+            return self.put_template(parts[1], payload)
+        if parts == ['agents'] and method == 'GET':
+            return {name: state.progress() for name, state in self.agents.items()}
+        if len(parts) == 3 and parts[0] == 'agents' and parts[2] == 'state':
+            if method == 'GET':
+                return await self.get_state(parts[1], since)
+            if method == 'PUT':
+                return await self.put_state(parts[1], payload)
+        if len(parts) == 3 and parts[0] == 'agents' and parts[2] == 'events' and method == 'POST':
+            return await self.post_events(parts[1], payload)
+        if parts == ['events'] and method == 'GET':
+            return await self.get_events(since, wait)
+        raise RequestError(404, f"no route for {method} {url.path}")
+
+    def put_template(self, name, payload):
+        tasks = payload.get('tasks')
+        if not isinstance(tasks, list) or not all(isinstance(text, str) for text in tasks):
+            raise RequestError(400, "tasks must be a list of strings")
+        self.version += 1
+        self.templates[name] = tuple(tasks)
+        self.template_versions[name] = self.version
+        self.dirty_templates.add(name)
+        for agent, state in self.agents.items():
+            if state.model.replace_template(name, tasks):
+                self.dirty_agents.add(agent)
+        return {'version': self.version}
+
+    async def get_state(self, name, since):
+        # Delta update: templates and call types changed after version `since`.
+        state = await self.agent(name, create=False)
+        if state is None:
+            return {'version': self.version, 'new': True}
+        model = state.model
+        return {
+            'version': self.version,
+            'templates': {t: list(self.templates[t]) for t, v in self.template_versions.items() if v > since},
+            'types': {ct: model.serialize_call_type(ct) for ct, v in state.versions.items() if v > since},
+        }
+
+    async def put_state(self, name, payload):
+        # Seed a new agent from its local checklists file, with the template copies its
+        # checklists refer to (see ChecklistModel), so their done state is carried over.
+        # The whole file is checked first, so a bad one leaves the agent as it was.
+        templates = payload.get('_templates', {})
+        if not isinstance(templates, dict) or not all(
+                isinstance(texts, list) and all(isinstance(text, str) for text in texts) for texts in templates.values()):
+            raise RequestError(400, "_templates must map names to lists of strings")
+        state = await self.agent(name, create=False)
+        model = state.model if state is not None else self.new_model({})
+        for call_type, options in payload.items():
+            if call_type.startswith('_'):
+                continue
+            if not isinstance(options, dict) or not all(isinstance(entry, dict) for entry in options.values()):
+                raise RequestError(400, f"{call_type}: checklists must be JSON objects")
+            try:
+                model.build_call_type(call_type, options)
+            except (KeyError, IndexError, TypeError, ValueError, AttributeError) as e:
+                raise RequestError(400, f"{call_type}: {type(e).__name__}: {e}")
+        state = await self.agent(name)
+        state.model.read_saved_templates(payload)
+        for call_type, options in payload.items():
+            if not call_type.startswith('_'):
+                state.model.replace_call_type(call_type, options)
+                self.bump(name, state, call_type)
+        return {'version': self.version}
+
+    async def post_events(self, name, payload):
+        # Apply a batch of events; a bad event is reported without rejecting the rest.
+        events = payload.get('events', [])
+        if not isinstance(events, list) or not all(isinstance(event, dict) for event in events):
+            raise RequestError(400, "events must be a list of JSON objects")
+        state = await self.agent(name)
+        errors = []
+        for i, event in enumerate(events):
+            try:
+                self.apply(name, state, event)
+            except (KeyError, IndexError, TypeError, ValueError, AttributeError) as e:
+                errors.append({'event': i, 'error': f"{type(e).__name__}: {e}"})
+        return {'version': self.version, 'errors': errors}
+
+    def apply(self, name, state, event):
+        kind, call_type, checklist_type = event['kind'], event['call_type'], event['checklist_type']
+        model = state.model
+        index = model.apply_event(event)
+        if kind == 'toggle':
+            text = model.checklist(call_type, checklist_type).texts[index]
+            self.record(name, kind, call_type, checklist_type, index, text, int(bool(event['done'])))
+        else:
+            self.record(name, kind, call_type, checklist_type)
+        state.current = (call_type, checklist_type, time.time())
+        self.bump(name, state, call_type)
+
+    async def get_events(self, since, wait):
+        # Long poll: answer as soon as there are events after `since`, or after `wait` seconds.
+        if self.seq <= since and wait > 0:
+            try:
+                await asyncio.wait_for(self.new_events.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+        oldest = self.recent[0]['seq'] if self.recent else self.seq + 1
+        if since < oldest - 1:
+            # Older than what is kept in memory: page through the database.
+            await self.flush()
+            rows = await self.store.run(lambda conn: conn.execute(
+                "SELECT seq, agent, at, kind, call_type, checklist_type, position, text, done "
+                "FROM events WHERE seq > ? ORDER BY seq LIMIT ?", (since, RECENT_EVENTS)).fetchall())
+            keys = ('seq', 'agent', 'at', 'kind', 'call_type', 'checklist_type', 'position', 'text', 'done')
+            return {'seq': rows[-1][0] if rows else since, 'events': [dict(zip(keys, row)) for row in rows]}
+        return {'seq': self.seq, 'events': [event for event in self.recent if event['seq'] > since]}
+
+
+async def serve(host, port, db, ready=None):
+    store = ServerStore(db)
+    server = ChecklistServer(store)
+    await server.start()
+    listener = await asyncio.start_server(server.handle, host, port, backlog=1024)
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C raises KeyboardInterrupt instead.
+    if ready is not None:
+        ready(listener.sockets[0].getsockname()[1])
+    try:
+        await stopping.wait()
+    finally:
+        listener.close()
+        await server.stop()
+        store.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve checklists to many app instances.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db", default="server.sqlite3")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.db,
+                          ready=lambda port: print(f"serving on {args.host}:{port}", flush=True)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
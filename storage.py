@@ -0,0 +1,435 @@
+import json
+import marshal
+import os
+import queue
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import nullcontext
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def atomic_write(path, data):
+    # Write to a temp file in the same directory and rename it over the target,
+    # so a crash mid-write leaves either the old file or the new one, never half of each.
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+# Snapshot header: magic, the Python version that wrote it (marshal's format is not
+# stable across versions), payload checksum and source count, then a checksum per source.
+SNAPSHOT_MAGIC = b"FYCS"
+SNAPSHOT_HEADER = struct.Struct("<4sIII")
+
+
+def write_snapshot(path, sources, payload):
+    # Store `payload` (plain dicts, lists and strings) precompiled with marshal, stamped
+    # with the checksums of the `sources` (a list of bytes) it was parsed from.
+    data = marshal.dumps(payload)
+    checksums = struct.pack(f"<{len(sources)}I", *(zlib.crc32(source) for source in sources))
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, sys.hexversion, zlib.crc32(data), len(sources))
+    atomic_write(path, header + checksums + data)
+
+
+def read_snapshot(path, sources):
+    """
+    The payload stored by write_snapshot() from these exact `sources`, or None when
+    the snapshot is missing, damaged, written by another Python or made from other data.
+    """
+    try:
+        with open(path, 'rb') as f:
+            blob = f.read()
+    except OSError:
+        return None
+    if len(blob) < SNAPSHOT_HEADER.size:
+        return None
+    magic, version, checksum, count = SNAPSHOT_HEADER.unpack_from(blob)
+    start = SNAPSHOT_HEADER.size + 4 * count
+    if magic != SNAPSHOT_MAGIC or version != sys.hexversion or count != len(sources) or len(blob) < start:
+        return None
+    if struct.unpack_from(f"<{count}I", blob, SNAPSHOT_HEADER.size) != tuple(zlib.crc32(s) for s in sources):
+        return None
+    payload = memoryview(blob)[start:]
+    if zlib.crc32(payload) != checksum:
+        return None
+    try:
+        return marshal.loads(payload)
+    except (EOFError, ValueError, TypeError):
+        return None
+
+
+def file_stamp(path):
+    # Cheap change detection: (mtime, size) of the file, or None if it does not exist.
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class FileLock:
+    """
+    Advisory lock on a sidecar file, held by whichever app instance is reading or
+    writing the shared data file. Blocks until the lock is free.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                # LK_LOCK gives up after ~10 seconds, so keep retrying.
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        pass
+        except BaseException:
+            os.close(fd)
+            self._thread_lock.release()
+            raise
+        self._fd = fd
+        return self
+
+    def __exit__(self, *exc):
+        fd, self._fd = self._fd, None
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+            self._thread_lock.release()
+
+
+def try_lock(fd):
+    # Take an exclusive lock on an open file without waiting; False if another process holds it.
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+# Journal record header: payload length and checksum.
+RECORD_HEADER = struct.Struct("<II")
+
+
+class Journal:
+    """
+    Append-only log of the changes made since the data file was last written, so
+    that a crash loses none of them. Each change costs an append of a few bytes
+    rather than a rewrite of the whole file.
+
+    append() only queues the records: a background thread writes (and fsyncs)
+    everything queued so far in one append, so callers never wait on the disk and a
+    burst of changes becomes one group commit. When the log passes `limit` bytes, or
+    cannot be written, the thread calls `checkpoint` to have the data file rewritten.
+
+    Records are JSON values framed by their length and checksum; reading stops at
+    the first torn or damaged record, which is what a crash mid-append leaves.
+    Every app instance needs its own log, so the first of `path`, `path.1`, `path.2`...
+    not locked by another running instance is used, along with whatever a crashed
+    instance left in it. With `exclusive`, only `path` itself is tried, and
+    BlockingIOError raised if a running instance holds it.
+
+    Before the data file is written, rotate() moves the log aside (while the data
+    being written is snapshotted); commit() drops that part once the write succeeded.
+    A failed write keeps it, to be replayed together with the newer records.
+    """
+    def __init__(self, path, sync=True, limit=None, checkpoint=None, exclusive=False):
+        self.sync = sync  # fsync each append, so it also survives a power cut.
+        self.limit = limit
+        self.checkpoint = checkpoint
+        self.error = None
+        self._lock = threading.Lock()
+        n = 0
+        while True:
+            self.path = path if n == 0 else f"{path}.{n}"
+            self._lock_fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+            if try_lock(self._lock_fd):
+                break
+            os.close(self._lock_fd)
+            if exclusive:
+                raise BlockingIOError(f"{path} is in use by a running instance")
+            n += 1
+        self.old_path = self.path + ".old"
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, 'O_BINARY', 0), 0o644)
+        self.size = os.fstat(self._fd).st_size
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="journal-writer", daemon=True)
+        self._thread.start()
+
+    def append(self, records):
+        # Queue records to be written together, in order; returns at once.
+        self._queue.put(list(records))
+
+    def flush(self):
+        # Wait until everything queued so far is written.
+        if not self._thread.is_alive():
+            return
+        written = threading.Event()
+        self._queue.put(written)
+        written.wait()
+
+    def _run(self):
+        closing = False
+        while not closing:
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = [record for item in items if isinstance(item, list) for record in item]
+            if records:
+                self._write(records)
+            for item in items:
+                if isinstance(item, threading.Event):
+                    item.set()
+            closing = None in items
+
+    def _write(self, records):
+        chunks = []
+        for record in records:
+            payload = json.dumps(record, separators=(',', ':')).encode('utf-8')
+            chunks.append(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        data = b"".join(chunks)
+        try:
+            with self._lock:
+                os.write(self._fd, data)
+                if self.sync:
+                    os.fsync(self._fd)
+                self.size += len(data)
+                full = self.limit is not None and self.size >= self.limit
+            self.error = None
+        except OSError as e:
+            self.error = e
+            full = True  # Not journaled: the data file itself has to be written now.
+        if full and self.checkpoint is not None:
+            self.checkpoint()
+
+    def read(self):
+        # Records not yet committed, oldest first.
+        records = []
+        for path in (self.old_path, self.path):
+            try:
+                with open(path, 'rb') as f:
+                    blob = f.read()
+            except FileNotFoundError:
+                continue
+            offset = 0
+            while offset + RECORD_HEADER.size <= len(blob):
+                length, checksum = RECORD_HEADER.unpack_from(blob, offset)
+                payload = blob[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + length]
+                if len(payload) != length or zlib.crc32(payload) != checksum:
+                    break
+                try:
+                    records.append(json.loads(payload))
+                except ValueError:
+                    break
+                offset += RECORD_HEADER.size + length
+        return records
+
+    def rotate(self):
+        # Move the log aside and start an empty one; appended to any part not yet committed.
+        with self._lock:
+            if not self.size:
+                return
+            if os.path.exists(self.old_path):
+                with open(self.path, 'rb') as src, open(self.old_path, 'ab') as dst:
+                    dst.write(src.read())
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.close(self._fd)
+            else:
+                os.close(self._fd)
+                os.replace(self.path, self.old_path)
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND
+                               | getattr(os, 'O_BINARY', 0), 0o644)
+            self.size = 0
+
+    def commit(self):
+        # The data file now holds everything rotated out; forget it.
+        try:
+            os.unlink(self.old_path)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        # Write what is still queued, then stop the writer thread; safe to call more than once.
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                os.close(self._lock_fd)
+                self._fd = self._lock_fd = None
+
+
+def orphaned_journals(path):
+    # Journals (`path`, `path.1`, ...) of app instances no longer running, each opened and so locked.
+    journals = []
+    n = 0
+    while True:
+        candidate = path if n == 0 else f"{path}.{n}"
+        if not os.path.exists(candidate + ".lock"):
+            return journals
+        try:
+            journals.append(Journal(candidate, exclusive=True))
+        except BlockingIOError:
+            pass
+        n += 1
+
+
+class WriteBehindSaver:
+    """
+    Persists data on a background thread instead of the Tk main thread.
+
+    mark_dirty() only flags the data as changed and returns immediately. The writer
+    thread waits until no change has arrived for `delay` seconds, takes a snapshot
+    under `lock` and writes it atomically, so a burst of clicks becomes one write.
+    With `max_delay`, changes that keep arriving are still written that many seconds
+    after the first of them.
+
+    When several processes share the file, pass a FileLock as `file_lock`: the
+    snapshot and write then happen while holding it. `poll`, if given, is called
+    under the same lock every `poll_interval` seconds, whether a write is pending
+    or not, to pick up changes written by other processes. `written`, if given, is called with the bytes
+    after each successful write (still on the writer thread).
+    """
+    def __init__(self, path, snapshot, delay=0.5, lock=None, file_lock=None, poll=None, poll_interval=2.0,
+                 written=None, max_delay=None):
+        self.path = path
+        self.snapshot = snapshot  # Callable returning the bytes to write.
+        self.delay = delay
+        self.max_delay = max_delay
+        # Held while the snapshot is taken; hold it while mutating the data it reads.
+        # Without one, the snapshot callable does its own locking.
+        self.lock = lock
+        self.file_lock = file_lock
+        self.poll = poll
+        self.poll_interval = poll_interval
+        self.written = written
+        self.writes = 0
+        self.error = None
+        self._cond = threading.Condition()
+        self._dirty = False
+        self._urgent = False
+        self._closed = False
+        self._first_change = self._last_change = 0.0
+        self._thread = threading.Thread(target=self._run, name="checklist-writer", daemon=True)
+        self._thread.start()
+
+    def mark_dirty(self, urgent=False):
+        # `urgent` writes without waiting for changes to stop arriving.
+        with self._cond:
+            self._last_change = time.monotonic()
+            if not self._dirty:
+                self._first_change = self._last_change
+            self._dirty = True
+            self._urgent = self._urgent or urgent
+            self._cond.notify()
+
+    def close(self):
+        # Flush anything pending right away and stop the writer thread.
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _write_due(self):
+        # When pending changes get written: once they stop arriving, or max_delay after the first.
+        due = self._last_change + self.delay
+        if self.max_delay is not None:
+            due = min(due, self._first_change + self.max_delay)
+        return due
+
+    def _run(self):
+        next_poll = time.monotonic() + self.poll_interval
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    if self._dirty and (self._closed or self._urgent or now >= self._write_due()):
+                        writing = True
+                        break
+                    if self._closed:
+                        return
+                    if self.poll and now >= next_poll:
+                        writing = False
+                        break
+                    # Debounce: keep waiting while changes are still arriving, polling meanwhile.
+                    timeout = self._write_due() - now if self._dirty else None
+                    if self.poll:
+                        timeout = next_poll - now if timeout is None else min(timeout, next_poll - now)
+                    self._cond.wait(timeout)
+                if writing:
+                    self._dirty = self._urgent = False
+                    closing = self._closed
+            if not writing:
+                self._poll()
+            elif not self._write() and not closing:
+                # Keep the data dirty so the write is retried after the next delay.
+                self.mark_dirty()
+            # A shared file's snapshot takes in other processes' changes too (see ChecklistModel.sync).
+            next_poll = time.monotonic() + self.poll_interval
+
+    def _poll(self):
+        try:
+            with self.file_lock or nullcontext():
+                self.poll()
+        except Exception as e:
+            self.error = e
+
+    def _write(self):
+        try:
+            with self.file_lock or nullcontext():
+                with self.lock or nullcontext():
+                    data = self.snapshot()
+                atomic_write(self.path, data)
+        except Exception as e:
+            self.error = e
+            return False
+        self.error = None
+        self.writes += 1
+        if self.written is not None:
+            try:
+                self.written(data)
+            except Exception as e:
+                self.error = e
+        return True
@@ -0,0 +1,161 @@
+"""
+Background sync between a local ChecklistModel and a checklist server (server.py).
+
+The local checklists file stays the app's offline cache: changes are made and saved
+locally as usual, queued here, and pushed to the server in batches when it can be
+reached. The server's changes (template pushes, edits made from another desk) come
+back as delta updates and are applied to the model as 'server' changes.
+"""
+import http.client
+import json
+import os
+import threading
+from urllib.parse import quote, urlsplit
+
+from model import CHECKLIST_CHANGES
+from storage import atomic_write
+
+
+class ServerSync:
+    """
+    Pushes local changes to the server and pulls its changes every `interval` seconds.
+
+    Events not yet pushed are kept in `pending_path` (rewritten by the sync thread
+    whenever the queue changes) and sent on the next start, after `unsent`: changes
+    recovered at startup, e.g. from the journal, which may never have been queued.
+    Pushing an event twice does no harm. A call type with local changes still queued
+    is not overwritten by the server's copy; it is pushed first and comes back on a
+    later pull.
+    """
+    def __init__(self, model, url, agent, pending_path=None, interval=1.0, timeout=5.0, unsent=()):
+        self.model = model
+        self.agent = quote(agent, safe='')
+        self.pending_path = pending_path
+        self.interval = interval
+        self.timeout = timeout
+        self.address = urlsplit(url)
+        self.conn = None
+        self.version = 0
+        self.online = False
+        self.error = None
+        self.pending = self._read_pending() + list(unsent)
+        self._pending_changed = bool(unsent)
+        self._cond = threading.Condition()
+        self._closed = False
+        model.listeners.append(self.on_change)
+        self._thread = threading.Thread(target=self._run, name="server-sync", daemon=True)
+        self._thread.start()
+
+    def on_change(self, kind, call_type, checklist_type, index):
+        # Changes that came from the server are not sent back.
+        if kind != 'toggle' and kind not in CHECKLIST_CHANGES and kind != 'merge':
+            return
+        events = self.model.change_events(kind, call_type, checklist_type, index)
+        with self._cond:
+            self.pending.extend(events)
+            self._pending_changed = True
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._save_pending()
+        if self.conn is not None:
+            self.conn.close()
+
+    def _read_pending(self):
+        if self.pending_path is None or not os.path.exists(self.pending_path):
+            return []
+        with open(self.pending_path, 'r') as f:
+            try:
+                return json.load(f)
+            except ValueError:
+                return []
+
+    def _save_pending(self):
+        # Write the queue to `pending_path` if it changed since last written; sync thread only.
+        with self._cond:
+            if not self._pending_changed:
+                return
+            pending, self._pending_changed = list(self.pending), False
+        if self.pending_path is None:
+            return
+        try:
+            if pending:
+                atomic_write(self.pending_path, json.dumps(pending, separators=(',', ':')).encode('utf-8'))
+            elif os.path.exists(self.pending_path):
+                os.unlink(self.pending_path)
+        except OSError as e:
+            self.error = e
+            with self._cond:
+                self._pending_changed = True
+
+    def _request(self, method, path, payload=None):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.address.hostname, self.address.port or 80,
+                                                   timeout=self.timeout)
+        body = None if payload is None else json.dumps(payload, separators=(',', ':'))
+        try:
+            self.conn.request(method, path, body, {'Content-Type': 'application/json'})
+            response = self.conn.getresponse()
+            data = json.loads(response.read())
+        except (OSError, http.client.HTTPException, ValueError):
+            self.conn.close()
+            self.conn = None
+            raise
+        if response.status != 200:
+            raise http.client.HTTPException(f"{method} {path}: {response.status} {data.get('error')}")
+        return data
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # Changes are pushed right away while online; otherwise wait for the next round.
+                if (not self.pending or not self.online) and not self._closed:
+                    self._cond.wait(self.interval)
+                closing = self._closed
+            try:
+                self._sync()
+                self.online, self.error = True, None
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                # Offline: keep working from the local file and retry on the next round.
+                self.online, self.error = False, e
+            # Keep the queue on disk as well, so a crash does not lose what is not pushed yet.
+            self._save_pending()
+            if closing:
+                return
+
+    def _sync(self):
+        if self.version == 0:
+            # First contact: an agent the server does not know yet is seeded from the local file.
+            if self._request('GET', f"/agents/{self.agent}/state?since=0").get('new'):
+                with self.model.lock:
+                    data = json.loads(self.model.dumps())
+                self.version = self._request('PUT', f"/agents/{self.agent}/state", data)['version']
+        with self._cond:
+            events, self.pending = self.pending, []
+            self._pending_changed = self._pending_changed or bool(events)
+        if events:
+            try:
+                self._request('POST', f"/agents/{self.agent}/events", {'events': events})
+            except BaseException:
+                with self._cond:
+                    self.pending[:0] = events
+                raise
+        state = self._request('GET', f"/agents/{self.agent}/state?since={self.version}")
+        for name, texts in state.get('templates', {}).items():
+            if tuple(texts) != self.model.templates.get(name):
+                self.model.replace_template(name, texts)
+        with self._cond:
+            queued = {event['call_type'] for event in self.pending}
+        for call_type, options in state.get('types', {}).items():
+            if call_type in queued:
+                continue
+            with self.model.lock:
+                if call_type in self.model.checklists or call_type in self.model.stored:
+                    if self.model.serialize_call_type(call_type) == options:
+                        continue
+            self.model.replace_call_type(call_type, options)
+        self.version = state['version']